@@ -1,11 +1,22 @@
-import os, json, re
+import os, json, re, asyncio, logging
 from typing import List, Dict, Optional
+from .metrics import timed, ALLOCATIONS, CLAUDE_TOKENS
 
-try:
-    import anthropic
-    _CLAUDE = True
-except Exception:
-    _CLAUDE = False
+logger = logging.getLogger(__name__)
+
+_anthropic = None
+
+
+def _claude():
+    """The anthropic module, imported on first use; None when the SDK is not installed."""
+    global _anthropic
+    if _anthropic is None:
+        try:
+            import anthropic
+            _anthropic = anthropic
+        except Exception:
+            _anthropic = False
+    return _anthropic or None
 
 SCHEMA_INSTRUCTIONS = (
     "You are Invoy's AI Billing Allocation Expert. "
@@ -24,61 +35,109 @@ OUTPUT_FORMAT = {
 }
 
 
+_HOURS_RE = re.compile(r"(\d+(?:\.\d+)?)\s*(?:h|hrs|hours)\b", re.I)
+_BULLET_RE = re.compile(r"^\s*(?:[-•*]|\d+[.)])\s")
+
+
+def _line_priority(line: str) -> int:
+    # When condensing, hour totals survive first, then bullet-style subjects, then prose
+    if _HOURS_RE.search(line):
+        return 0
+    if _BULLET_RE.match(line) or len(line) <= 80:
+        return 1
+    return 2
+
+
 def _heuristic_parse_freeform(text: str) -> Dict:
     # Try to find hours number in text
     m = re.search(r"(\d+(?:\.\d+)?)\s*(?:h|hrs|hours)", text, re.I)
     total = float(m.group(1)) if m else 0.0
-    # Split subjects by lines or punctuation
-    lines = [s.strip(" -•\n\t") for s in re.split(r"[\n;]", text) if s.strip()]
-    # Remove lines that look like hours mention
-    subjects = [l for l in lines if not re.search(r"\bhours?\b", l, re.I)]
+    # Split subjects by lines or punctuation, without hour totals
+    from .prompt_budget import split_subjects
+    subjects = split_subjects(text)
     subjects = subjects[:10] if subjects else [text[:60] + ('…' if len(text) > 60 else '')]
     return {"client_name": None, "total_hours_billed": total, "subjects": subjects}
 
 
+def _heuristic_allocation(freeform: str, default_client: Optional[str], default_hours: Optional[float]) -> Dict:
+    parsed = _heuristic_parse_freeform(freeform)
+    client = parsed.get('client_name') or (default_client or 'Unknown Client')
+    total = parsed.get('total_hours_billed') or (default_hours or 0.0)
+    return {
+        "client_name": client,
+        "total_hours_billed": float(total),
+        "billing_period": "Monthly",
+        "line_items": [
+            {"subject": s, "estimated_hours": round(float(total)/(len(parsed['subjects']) or 1), 1), "justification": "Even split (fallback)"}
+            for s in parsed['subjects']
+        ],
+        "confidence": 0.2,
+        "path": "heuristic",
+    }
+
+
 async def parse_freeform_with_claude(freeform: str, default_client: Optional[str], default_hours: Optional[float]) -> Dict:
-    if not _CLAUDE or not os.getenv('ANTHROPIC_API_KEY'):
+    """Allocation from Claude, or the heuristic without an API key or a usable reply.
+
+    The input is deduplicated and, past ALLOCATE_INPUT_TOKENS, condensed to its hour totals
+    and subject-like lines (backend/prompt_budget.py). max_tokens follows the number of
+    subjects found, and `usage` in the result reports estimated and actual token counts.
+    """
+    from .prompt_budget import prepare, output_budget, split_subjects
+    prepared = prepare(freeform, _line_priority)
+    if not os.getenv('ANTHROPIC_API_KEY') or not _claude():
         # fallback to heuristic only
-        parsed = _heuristic_parse_freeform(freeform)
-        client = parsed.get('client_name') or (default_client or 'Unknown Client')
-        total = parsed.get('total_hours_billed') or (default_hours or 0.0)
-        return {
-            "client_name": client,
-            "total_hours_billed": float(total),
-            "billing_period": "Monthly",
-            "line_items": [
-                {"subject": s, "estimated_hours": round(float(total)/(len(parsed['subjects']) or 1), 1), "justification": "Even split (fallback)"}
-                for s in parsed['subjects']
-            ],
-            "confidence": 0.2
-        }
-
-    client = anthropic.Anthropic()
+        usage = {**prepared.stats(), 'max_tokens': None, 'input_tokens': 0, 'output_tokens': 0, 'stop_reason': None}
+        return {**_heuristic_allocation(prepared.text or freeform, default_client, default_hours), "usage": usage}
+
+    hints = _heuristic_parse_freeform(prepared.text)
+    # Counted the way the heuristic splits them, so "20h: A, B, C" is three subjects
+    n_subjects = len(split_subjects(prepared.text))
+    max_tokens = output_budget(n_subjects)
+    subjects_hint = f"about {n_subjects} subjects" if n_subjects else "subjects not pre-extracted"
+    client = _claude().Anthropic()
     prompt = (
         SCHEMA_INSTRUCTIONS + "\n\n"
-        + "Freeform input:\n" + freeform + "\n\n"
+        + "Freeform input:\n" + prepared.text + "\n\n"
+        + (f"Pre-extracted: total hours {hints['total_hours_billed']:g}, {subjects_hint}. Verify against the input.\n"
+           if hints['total_hours_billed'] else f"Pre-extracted: {subjects_hint}.\n")
+        + ("Repeated and low-information lines were removed from a longer input.\n" if prepared.dropped_lines else "")
         + "Constraints:\n"
         + "- Sum of estimated_hours must equal total_hours_billed.\n"
+        + "- Merge near-duplicate subjects; keep each justification to one short sentence.\n"
         + "- JSON only, no prose.\n"
         + "If client name or total hours are missing, infer from context or set to defaults.\n"
         + f"Defaults: client={default_client or 'Unknown Client'}, total_hours={default_hours or 0.0}.\n"
         + "JSON schema keys: client_name, total_hours_billed, billing_period, line_items[{subject, estimated_hours, justification}], confidence.\n"
     )
-    resp = client.messages.create(
-        model=os.getenv('ANTHROPIC_MODEL', 'claude-3-5-sonnet-20240620'),
-        max_tokens=1024,
-        temperature=0.2,
-        messages=[{"role": "user", "content": prompt}],
-    )
+    # The SDK call blocks; keep it off the event loop
+    with timed("claude_call"):
+        resp = await asyncio.to_thread(
+            client.messages.create,
+            model=os.getenv('ANTHROPIC_MODEL', 'claude-3-5-sonnet-20240620'),
+            max_tokens=max_tokens,
+            temperature=0.2,
+            messages=[{"role": "user", "content": prompt}],
+        )
+    usage = getattr(resp, 'usage', None)
+    input_tokens, output_tokens = getattr(usage, 'input_tokens', None), getattr(usage, 'output_tokens', None)
+    CLAUDE_TOKENS.inc(input_tokens or 0, call='allocate', kind='input')
+    CLAUDE_TOKENS.inc(output_tokens or 0, call='allocate', kind='output')
+    usage = {**prepared.stats(), 'max_tokens': max_tokens, 'input_tokens': input_tokens, 'output_tokens': output_tokens,
+             'stop_reason': getattr(resp, 'stop_reason', None)}
     text = resp.content[0].text if getattr(resp, 'content', None) else ''
     try:
         data = json.loads(text)
     except Exception:
         # try to extract JSON block
         m = re.search(r"\{[\s\S]*\}", text)
-        data = json.loads(m.group(0)) if m else None
+        try:
+            data = json.loads(m.group(0)) if m else None
+        except ValueError:
+            data = None
     if not data:
-        return await parse_freeform_with_claude(freeform, default_client, default_hours)  # fallback heuristic
+        logger.warning("unusable claude allocation reply stop_reason=%s, using heuristic", usage['stop_reason'])
+        return {**_heuristic_allocation(prepared.text or freeform, default_client, default_hours), "usage": usage}
     # normalize
     total = float(data.get('total_hours_billed') or default_hours or 0.0)
     items = data.get('line_items') or []
@@ -95,9 +154,22 @@ async def parse_freeform_with_claude(freeform: str, default_client: Optional[str
         "total_hours_billed": total,
         "billing_period": data.get('billing_period') or 'Monthly',
         "line_items": items,
-        "confidence": float(data.get('confidence') or 0.6)
+        "confidence": float(data.get('confidence') or 0.6),
+        "path": "claude",
+        "usage": usage,
     }
 
+async def allocate_freeform(freeform: str, default_client: Optional[str], default_hours: Optional[float]) -> Dict:
+    """Reuse a past allocation for recurring work; Claude only when no local match is confident.
+    The result's `path` says which one answered (local, claude or heuristic).
+    """
+    from .allocator import memory
+    result = await asyncio.to_thread(memory.suggest, freeform, default_client, default_hours)
+    if result is None:
+        result = await parse_freeform_with_claude(freeform, default_client, default_hours)
+    ALLOCATIONS.inc(path=result['path'])
+    return result
+
 async def allocate_hours(client: str, total_hours: float, subjects: List[str], billing_period: str | None) -> Dict:
     # Existing deterministic allocation for structured input
     if subjects:
@@ -109,9 +181,9 @@ async def allocate_hours(client: str, total_hours: float, subjects: List[str], b
         if rounded:
             rounded[-1] = round(rounded[-1] + diff, 1)
         items = [{"subject": s.strip(), "estimated_hours": float(h), "justification": "Proportional allocation."} for s, h in zip(subjects, rounded)]
-        return {"client_name": client, "total_hours_billed": float(total_hours), "billing_period": billing_period or "Monthly", "line_items": items, "confidence": 0.4}
+        return {"client_name": client, "total_hours_billed": float(total_hours), "billing_period": billing_period or "Monthly", "line_items": items, "confidence": 0.4, "path": "proportional"}
     # No subjects provided: treat `client` as default client, and `total_hours` may be 0; expect caller to pass freeform in 'client' or separate param.
-    return {"client_name": client, "total_hours_billed": float(total_hours), "billing_period": billing_period or "Monthly", "line_items": [], "confidence": 0.0}
+    return {"client_name": client, "total_hours_billed": float(total_hours), "billing_period": billing_period or "Monthly", "line_items": [], "confidence": 0.0, "path": "proportional"}
 
 
 async def generate_email_body(invoice_data: Dict) -> str:
@@ -127,7 +199,7 @@ async def generate_email_body(invoice_data: Dict) -> str:
     except:
         consultant_name = invoice_data.get('consultant_name', 'Your Consultant')
     
-    if not _CLAUDE or not os.getenv('ANTHROPIC_API_KEY'):
+    if not os.getenv('ANTHROPIC_API_KEY') or not _claude():
         # Fallback email template
         work_summary = (invoice_data.get('work_summary') or '').strip()
         return f"""
@@ -155,7 +227,7 @@ async def generate_email_body(invoice_data: Dict) -> str:
 """
     
     # Use Claude to generate personalized email
-    client_api = anthropic.Anthropic()
+    client_api = _claude().Anthropic()
     work_summary = (invoice_data.get('work_summary') or '').strip()
     prompt = f"""Write a warm, professional email to send an invoice to a client. 
 
@@ -179,13 +251,19 @@ Key points to include:
 
 Return ONLY the HTML email body (no subject, no greetings like "Subject:"). Use simple HTML formatting."""
 
-    resp = client_api.messages.create(
-        model=os.getenv('ANTHROPIC_MODEL', 'claude-3-5-sonnet-20240620'),
-        max_tokens=500,
-        temperature=0.3,
-        messages=[{"role": "user", "content": prompt}],
-    )
+    # The SDK call blocks; run it on a thread so background drafts don't stall the event loop
+    with timed("claude_call"):
+        resp = await asyncio.to_thread(
+            client_api.messages.create,
+            model=os.getenv('ANTHROPIC_MODEL', 'claude-3-5-sonnet-20240620'),
+            max_tokens=500,
+            temperature=0.3,
+            messages=[{"role": "user", "content": prompt}],
+        )
     
+    usage = getattr(resp, 'usage', None)
+    CLAUDE_TOKENS.inc(getattr(usage, 'input_tokens', 0) or 0, call='email', kind='input')
+    CLAUDE_TOKENS.inc(getattr(usage, 'output_tokens', 0) or 0, call='email', kind='output')
     email_html = resp.content[0].text if getattr(resp, 'content', None) else ''
     return email_html if email_html else f"Please find attached invoice {invoice_data.get('invoice_id')} for {invoice_data.get('client_name')}."
 
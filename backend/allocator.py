@@ -0,0 +1,241 @@
+import json
+import logging
+import math
+import os
+import re
+import threading
+import zlib
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from .artifacts import client_key
+
+try:
+    import numpy as np
+except ImportError:  # pure-Python dot products instead
+    np = None
+
+logger = logging.getLogger(__name__)
+
+# Below this cosine similarity the request goes to Claude (or the heuristic)
+ALLOCATOR_MIN_CONFIDENCE = float(os.getenv('ALLOCATOR_MIN_CONFIDENCE', '0.85'))
+# Most recent finalized allocations kept in memory for matching
+ALLOCATOR_MAX_ENTRIES = int(os.getenv('ALLOCATOR_MAX_ENTRIES', '2000'))
+
+# A subject counts as the same work as a past one at this similarity ("API gateway" ~ "API gateway setup")
+SUBJECT_MIN_SIMILARITY = 0.6
+
+# Justification ai._heuristic_allocation writes; such allocations are never recorded
+HEURISTIC_JUSTIFICATION = 'Even split (fallback)'
+
+DIM = 2 ** 11
+_HOURS_RE = re.compile(r"(\d+(?:\.\d+)?)\s*(?:h|hrs|hours)\b", re.I)
+_WORD_RE = re.compile(r"[a-z][a-z0-9+#.-]*")
+
+
+def _features(text: str) -> Dict[int, float]:
+    """Hashed word uni/bigrams and character trigrams, sublinear TF, L2-normalized.
+
+    Hour counts are dropped first: "Sprint planning 10h" and "Sprint planning 12h"
+    are the same recurring work.
+    """
+    words = _WORD_RE.findall(_HOURS_RE.sub(' ', text.lower()))
+    grams = words + [f'{a} {b}' for a, b in zip(words, words[1:])]
+    for w in words:
+        padded = f' {w} '
+        grams += [padded[i:i + 3] for i in range(len(padded) - 2)]
+    counts: Dict[int, float] = {}
+    for g in grams:
+        h = zlib.crc32(g.encode())
+        # Signed hashing so bucket collisions cancel out instead of inflating similarity
+        idx, sign = h % DIM, 1.0 if (h >> 31) & 1 else -1.0
+        counts[idx] = counts.get(idx, 0.0) + sign
+    vec = {i: math.copysign(1.0 + math.log(abs(v)), v) for i, v in counts.items() if v}
+    norm = math.sqrt(sum(v * v for v in vec.values())) or 1.0
+    return {i: v / norm for i, v in vec.items()}
+
+
+def _dot(a: Dict[int, float], b: Dict[int, float]) -> float:
+    if len(a) > len(b):
+        a, b = b, a
+    return sum(v * b.get(i, 0.0) for i, v in a.items())
+
+
+def _history_key(client: str) -> str:
+    """Client directory key when the name resolves, so "acme" and "Acme Corp" share history;
+    else the client's slug."""
+    from .clients import get_directory
+    try:
+        hit = get_directory().lookup(client)
+    except Exception as e:
+        logger.debug("client directory lookup failed: %s", e)
+        hit = None
+    return hit.key.lower() if hit is not None else client_key(client).lower()
+
+
+def _unmatched(subjects: List[str], others: List[str]) -> List[str]:
+    """Subjects with no counterpart in `others` at SUBJECT_MIN_SIMILARITY."""
+    vectors = [_features(o) for o in others]
+    return [s for s in subjects
+            if not any(_dot(_features(s), v) >= SUBJECT_MIN_SIMILARITY for v in vectors)]
+
+
+def _round_to_total(hours: List[float], total: float) -> List[float]:
+    """Scale to `total`, round to 0.1 and put the rounding remainder on the last item."""
+    current = sum(hours) or 1.0
+    vals = [round(h * total / current * 10) / 10 for h in hours]
+    if vals:
+        vals[-1] = round(vals[-1] + round(total - sum(vals), 1), 1)
+    return vals
+
+
+class AllocationMemory:
+    """Finalized allocations, matched against new freeform input by cosine similarity.
+
+    Entries live in the `allocations` DB table and are loaded on first use. With
+    NumPy installed all entries are scored in one matrix-vector product (~2 ms for
+    2000 entries); otherwise the sparse vectors are compared in Python, which is fine
+    for one client's history of a few hundred allocations.
+    """
+
+    def __init__(self, max_entries: int = ALLOCATOR_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self.entries: List[Dict] = []
+        self._vectors: List[Dict[int, float]] = []
+        self._keys: List[str] = []  # _history_key per entry, for per-client search
+        self._matrix = None  # NumPy copy of _vectors, rebuilt lazily after changes
+        self._loaded = False
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def _add(self, entry: Dict) -> None:
+        self.entries.append(entry)
+        self._vectors.append(_features(entry['text']))
+        self._keys.append(_history_key(entry['client']))
+        if len(self.entries) > self.max_entries:
+            del self.entries[0], self._vectors[0], self._keys[0]
+        self._matrix = None
+
+    def load(self) -> None:
+        with self._lock:
+            if self._loaded:
+                return
+            self._loaded = True
+            try:
+                from .db import SessionLocal, AllocationRecord
+                db = SessionLocal()
+                try:
+                    rows = (db.query(AllocationRecord).order_by(AllocationRecord.id.desc())
+                            .limit(self.max_entries).all())
+                finally:
+                    db.close()
+            except Exception as e:
+                logger.warning("allocation memory unavailable: %s", e)
+                return
+            for row in reversed(rows):
+                self._add(row.as_entry())
+            logger.info("allocation memory loaded entries=%d", len(self.entries))
+
+    def record(self, client: str, line_items: List[Dict], billing_period: Optional[str],
+               freeform: Optional[str] = None, source: Optional[str] = None) -> None:
+        """Remember a finalized allocation. Without the freeform text the subjects stand in for it.
+
+        `source` is the allocation's `path`. Heuristic even splits aren't learned from:
+        replaying them later as confident matches would pass a guess off as history.
+        """
+        if source == 'heuristic' or (line_items and all(i.get('justification') == HEURISTIC_JUSTIFICATION for i in line_items)):
+            logger.debug("not recording heuristic allocation client=%s", client)
+            return
+        items = [{'subject': (i.get('subject') or '').strip(),
+                  'estimated_hours': float(i.get('estimated_hours') or i.get('hours') or 0),
+                  'justification': i.get('justification') or ''} for i in line_items]
+        items = [i for i in items if i['subject']]
+        if not items:
+            return
+        text = (freeform or '').strip() or '\n'.join(i['subject'] for i in items)
+        entry = {
+            'client': client, 'text': text, 'line_items': items,
+            'total_hours': round(sum(i['estimated_hours'] for i in items), 1),
+            'billing_period': billing_period or 'Monthly',
+        }
+        self.load()
+        from .db import SessionLocal, AllocationRecord
+        db = SessionLocal()
+        try:
+            row = AllocationRecord(client=client, client_key=_history_key(client), text=text,
+                                   line_items=json.dumps(items), total_hours=entry['total_hours'],
+                                   billing_period=entry['billing_period'], created_at=datetime.utcnow())
+            db.add(row)
+            db.commit()
+            entry['id'] = row.id
+        finally:
+            db.close()
+        with self._lock:
+            self._add(entry)
+
+    def _scores(self, query: Dict[int, float], candidates: List[int]) -> List[float]:
+        if np is not None:
+            if self._matrix is None:
+                m = np.zeros((len(self._vectors), DIM), dtype=np.float32)
+                for row, vec in enumerate(self._vectors):
+                    m[row, list(vec)] = list(vec.values())
+                self._matrix = m
+            q = np.zeros(DIM, dtype=np.float32)
+            q[list(query)] = list(query.values())
+            # One product over every entry is cheaper than gathering the candidate rows
+            scores = self._matrix @ q
+            return scores[candidates].tolist()
+        return [_dot(query, self._vectors[i]) for i in candidates]
+
+    def suggest(self, freeform: str, default_client: Optional[str] = None,
+                default_hours: Optional[float] = None,
+                min_confidence: float = ALLOCATOR_MIN_CONFIDENCE) -> Optional[Dict]:
+        """Allocation reused from the most similar past one, or None if nothing is close enough.
+
+        With a client given only that client's history is searched. Hours are rescaled
+        to the total in the text (or `default_hours`), else the past total is kept.
+        The past allocation is only reused when the subjects match both ways: a new
+        subject, or a past one that's gone, goes to Claude instead of being billed under
+        the old line items.
+        """
+        self.load()
+        query = _features(freeform)
+        if not query:
+            return None
+        with self._lock:
+            if default_client:
+                key = _history_key(default_client)
+                candidates = [i for i, k in enumerate(self._keys) if k == key]
+            else:
+                candidates = list(range(len(self.entries)))
+            if not candidates:
+                return None
+            scores = self._scores(query, candidates)
+            best = max(range(len(candidates)), key=lambda i: (scores[i], candidates[i]))
+            score, entry = scores[best], self.entries[candidates[best]]
+        if score < min_confidence:
+            logger.debug("local allocation below threshold score=%.3f", score)
+            return None
+        from .prompt_budget import split_subjects
+        subjects, past = split_subjects(freeform), split_subjects(entry['text'])
+        new, gone = _unmatched(subjects, past), _unmatched(past, subjects)
+        if new or gone:
+            logger.debug("local allocation subjects differ score=%.3f new=%s gone=%s", score, new, gone)
+            return None
+        m = _HOURS_RE.search(freeform)
+        total = float(m.group(1)) if m else float(default_hours or entry['total_hours'])
+        hours = _round_to_total([i['estimated_hours'] for i in entry['line_items']], total)
+        return {
+            'client_name': default_client or entry['client'],
+            'total_hours_billed': total,
+            'billing_period': entry['billing_period'],
+            'line_items': [{**i, 'estimated_hours': float(h)} for i, h in zip(entry['line_items'], hours)],
+            'confidence': round(float(score), 3),
+            'path': 'local',
+            'matched_allocation': entry.get('id'),
+        }
+
+
+memory = AllocationMemory()
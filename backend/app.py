@@ -1,27 +1,43 @@
+from pathlib import Path
+from dotenv import load_dotenv
+
+# Load .env file from project root, before modules that read settings at import time
+load_dotenv(Path(__file__).resolve().parents[1] / '.env')
+
 from fastapi import FastAPI, UploadFile, File, Form, Request
-from fastapi.responses import JSONResponse, Response
+from fastapi.responses import JSONResponse, Response, FileResponse
 from pydantic import BaseModel
-from .stt import transcribe_audio
 from .ai import allocate_hours
 from .utils import finalize_invoice
-from pathlib import Path
-from dotenv import load_dotenv
+import asyncio
+import logging
 import os
-from fastapi.templating import Jinja2Templates
+import time
+from functools import lru_cache
 from fastapi.responses import HTMLResponse
 from fastapi.staticfiles import StaticFiles
-from fastapi.templating import Jinja2Templates
 from backend.calender_routes import router as calendar_router
+from .startup import lifespan
+from . import metrics, profiling, stt
+from .artifacts import OUTPUT
 
-# Load .env file from project root
-load_dotenv(Path(__file__).resolve().parents[1] / '.env')
+logging.basicConfig(
+    level=os.getenv('LOG_LEVEL', 'INFO').upper(),
+    format='%(asctime)s %(levelname)s %(name)s %(message)s',
+)
+logger = logging.getLogger(__name__)
 
-templates = Jinja2Templates(directory="templates")
+@lru_cache(maxsize=None)
+def _templates():
+    from fastapi.templating import Jinja2Templates
+    return Jinja2Templates(directory="templates")
 
-app = FastAPI(title="Invoy Backend", version="0.1.0")
+# Heavy subsystems load lazily; the lifespan warms the ones named in INVOY_WARMUP
+app = FastAPI(title="Invoy Backend", version="0.1.0", lifespan=lifespan)
+# Lets the profiler follow sync endpoints into the thread pool
+app.router.route_class = profiling.ProfilingRoute
 
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.staticfiles import StaticFiles
 
 app.add_middleware(CORSMiddleware, allow_origins=['*'], allow_methods=['*'], allow_headers=['*'])
 
@@ -30,7 +46,7 @@ app.include_router(calendar_router, prefix="", tags=["Calendar"])
 
 @app.get("/login", response_class=HTMLResponse)
 async def get_login_page(request: Request):
-    return templates.TemplateResponse("login.html", {"request": request})
+    return _templates().TemplateResponse("login.html", {"request": request})
 
 # No-cache for HTML to always serve fresh UI
 @app.middleware("http")
@@ -42,6 +58,57 @@ async def no_cache_html(request: Request, call_next):
         response.headers["Pragma"] = "no-cache"
     return response
 
+# Per-route latency; label by route template so path params don't blow up cardinality
+@app.middleware("http")
+async def record_latency(request: Request, call_next):
+    start = time.perf_counter()
+    status = 500
+    try:
+        response: Response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        route = request.scope.get("route")
+        metrics.REQUEST_LATENCY.observe(
+            time.perf_counter() - start,
+            route=getattr(route, "path", "<other>"),
+            method=request.method,
+            status=str(status),
+        )
+
+def _threadpool_stats():
+    from anyio.to_thread import current_default_thread_limiter
+    return current_default_thread_limiter().statistics()
+
+# Sync endpoints (calendar, finalize) run on anyio's default thread pool
+metrics.EXECUTOR_QUEUE.register(lambda: _threadpool_stats().tasks_waiting, executor="threadpool")
+metrics.EXECUTOR_BUSY.register(lambda: _threadpool_stats().borrowed_tokens, executor="threadpool")
+# Transcriptions on the STT decoder process pool (backend/stt.py)
+metrics.EXECUTOR_QUEUE.register(lambda: max(0, stt.inflight() - stt.STT_WORKERS), executor="stt")
+metrics.EXECUTOR_BUSY.register(lambda: min(stt.inflight(), stt.STT_WORKERS), executor="stt")
+
+@app.get("/metrics")
+async def metrics_endpoint():
+    return Response(metrics.render(), media_type="text/plain; version=0.0.4")
+
+# Opt-in request profiling: X-Profile: 1 (or ?profile=1) with X-Admin-Token, or PROFILE_SAMPLE_RATE
+app.middleware("http")(profiling.profile_requests)
+
+@app.get("/profiles")
+async def list_profiles(request: Request):
+    if not profiling.is_admin(request):
+        return JSONResponse({"error": "forbidden"}, status_code=403)
+    return {"profiles": profiling.list_profiles()}
+
+@app.get("/profiles/{profile_id}")
+async def get_profile(profile_id: str, request: Request, format: str = "html"):
+    if not profiling.is_admin(request):
+        return JSONResponse({"error": "forbidden"}, status_code=403)
+    path = profiling.find_profile(profile_id, format)
+    if path is None:
+        return JSONResponse({"error": "profile not found"}, status_code=404)
+    return FileResponse(path)
+
 class AllocateRequest(BaseModel):
     client: str | None = None
     total_hours: float | None = None
@@ -49,26 +116,145 @@ class AllocateRequest(BaseModel):
     freeform: str | None = None
     billing_period: str | None = None
 
+AUDIO_EXTENSIONS = {'.wav', '.webm', '.mp3', '.m4a', '.ogg', '.oga', '.flac', '.mp4'}
+STT_BATCH_MAX_FILES = int(os.getenv('STT_BATCH_MAX_FILES', '100'))
+# Per-recording and per-batch caps on audio bytes, checked against zip headers before anything
+# is extracted and again on the bytes actually written (headers can lie)
+STT_MAX_FILE_BYTES = int(os.getenv('STT_MAX_FILE_BYTES', str(256 * 1024 * 1024)))
+STT_BATCH_MAX_BYTES = int(os.getenv('STT_BATCH_MAX_BYTES', str(1024 * 1024 * 1024)))
+
+
+def _upload_path(filename: str, tmpdir: str, n: int) -> str:
+    # Prefixed with the upload index so two files with the same name don't collide
+    return os.path.join(tmpdir, f"{n:04d}_{os.path.basename(filename) or 'audio.wav'}")
+
+
+def _save_upload(data: bytes, filename: str, tmpdir: str, n: int) -> str:
+    path = _upload_path(filename, tmpdir, n)
+    with open(path, "wb") as f:
+        f.write(data)
+    return path
+
+
+def _extract_member(zf, info, tmpdir: str, n: int, limit: int) -> tuple[str, int]:
+    """Stream one zip member to disk, stopping once it passes `limit` bytes; returns (path, size)."""
+    path = _upload_path(info.filename, tmpdir, n)
+    size = 0
+    with zf.open(info) as src, open(path, "wb") as dst:
+        while chunk := src.read(1024 * 1024):
+            size += len(chunk)
+            if size > limit:
+                raise ValueError(f"{info.filename}: more than {limit} bytes uncompressed")
+            dst.write(chunk)
+    return path, size
+
+
+def _unpack_uploads(uploads, tmpdir: str):
+    """(filename, path) per audio file; zip archives contribute their audio members.
+
+    Raises ValueError when the batch goes over STT_BATCH_MAX_FILES files, or a file or the
+    batch goes over its byte cap; zip members are counted and sized before any is extracted.
+    """
+    import zipfile, io
+    files = []
+    total = 0
+
+    def admit(name: str, size: int):
+        nonlocal total
+        if len(files) >= STT_BATCH_MAX_FILES:
+            raise ValueError(f"more than {STT_BATCH_MAX_FILES} audio files")
+        if size > STT_MAX_FILE_BYTES:
+            raise ValueError(f"{name}: more than {STT_MAX_FILE_BYTES} bytes")
+        if total + size > STT_BATCH_MAX_BYTES:
+            raise ValueError(f"batch is more than {STT_BATCH_MAX_BYTES} bytes")
+        total += size
+
+    for name, data in uploads:
+        if name.lower().endswith('.zip'):
+            with zipfile.ZipFile(io.BytesIO(data)) as zf:
+                members = sorted((i for i in zf.infolist()
+                                  if not i.is_dir() and os.path.splitext(i.filename)[1].lower() in AUDIO_EXTENSIONS),
+                                 key=lambda i: i.filename)
+                if len(files) + len(members) > STT_BATCH_MAX_FILES:
+                    raise ValueError(f"more than {STT_BATCH_MAX_FILES} audio files")
+                declared = sum(i.file_size for i in members)
+                if total + declared > STT_BATCH_MAX_BYTES:
+                    raise ValueError(f"batch is more than {STT_BATCH_MAX_BYTES} bytes")
+                for info in members:
+                    if info.file_size > STT_MAX_FILE_BYTES:
+                        raise ValueError(f"{info.filename}: more than {STT_MAX_FILE_BYTES} bytes")
+                for info in members:
+                    limit = min(STT_MAX_FILE_BYTES, STT_BATCH_MAX_BYTES - total)
+                    path, size = _extract_member(zf, info, tmpdir, len(files), limit)
+                    total += size
+                    files.append((info.filename, path))
+        else:
+            admit(name, len(data))
+            files.append((name, _save_upload(data, name, tmpdir, len(files))))
+    return files
+
+
 @app.post("/stt")
 async def stt_endpoint(file: UploadFile = File(...)):
-    # Save the uploaded file temporarily
-    temp_path = f"temp_{file.filename}"
-    with open(temp_path, "wb") as f:
-        f.write(await file.read())
-        print("Saved uploaded file to:", temp_path)
-    #Call the transcription function
-    text = transcribe_audio(temp_path)
+    import tempfile, shutil
+    from .stt import transcribe_async
+    tmpdir = tempfile.mkdtemp(prefix="invoy-stt-")
+    try:
+        temp_path = _save_upload(await file.read(), file.filename, tmpdir, 0)
+        logger.debug("saved upload path=%s", temp_path)
+        # Decoded on the STT worker pool so the event loop stays free
+        result = await transcribe_async(temp_path)
+    finally:
+        shutil.rmtree(tmpdir, ignore_errors=True)
+
+    # text plus how much silence the VAD skipped (skipped_ratio, duration_s, voiced_s)
+    return result
 
-    # Remove temp file
-    os.remove(temp_path)
 
-    return {"text": text}
+@app.post("/stt/batch")
+async def stt_batch(files: list[UploadFile] = File(...), concatenate: bool = Form(False)):
+    """Transcribe several recordings (or a zip of them) in parallel.
+
+    Streams NDJSON: one line per file as it finishes, in completion order, then a
+    summary line. With concatenate=true the summary carries `freeform`: every
+    transcript in upload order, one per line, ready for /ai-invoice/allocate.
+    """
+    import json, tempfile, shutil
+    from fastapi.responses import StreamingResponse
+    from .stt import transcribe_many
+    uploads = [(f.filename or "audio.wav", await f.read()) for f in files]
+    tmpdir = tempfile.mkdtemp(prefix="invoy-stt-")
+    try:
+        saved = await asyncio.to_thread(_unpack_uploads, uploads, tmpdir)
+    except Exception as e:
+        shutil.rmtree(tmpdir, ignore_errors=True)
+        return JSONResponse({"error": f"could not read uploads: {e}"}, status_code=400)
+    if not saved:
+        shutil.rmtree(tmpdir, ignore_errors=True)
+        return JSONResponse({"error": f"expected 1-{STT_BATCH_MAX_FILES} audio files, got {len(saved)}"}, status_code=400)
+
+    async def results():
+        texts = [None] * len(saved)
+        failed = 0
+        try:
+            async for i, result in transcribe_many([path for _, path in saved]):
+                failed += "error" in result
+                texts[i] = result.get("text")
+                yield json.dumps({"index": i, "filename": saved[i][0], **result}) + "\n"
+        finally:
+            shutil.rmtree(tmpdir, ignore_errors=True)
+        summary = {"done": True, "files": len(saved), "failed": failed}
+        if concatenate:
+            summary["freeform"] = "\n".join(t for t in texts if t)
+        yield json.dumps(summary) + "\n"
+
+    return StreamingResponse(results(), media_type="application/x-ndjson")
 
 @app.post("/ai-invoice/allocate")
 async def ai_allocate(req: AllocateRequest):
-    from .ai import parse_freeform_with_claude
+    from .ai import allocate_freeform
     if req.freeform:
-        parsed = await parse_freeform_with_claude(req.freeform, req.client, req.total_hours)
+        parsed = await allocate_freeform(req.freeform, req.client, req.total_hours)
         return JSONResponse(parsed)
     result = await allocate_hours(req.client or "Unknown Client", float(req.total_hours or 0), req.work_subjects or [], req.billing_period)
     return JSONResponse(result)
@@ -77,10 +263,20 @@ class FinalizeRequest(BaseModel):
     client: str
     line_items: list[dict]
     billing_period: str | None = None
+    freeform: str | None = None  # the text that was allocated; lets the local allocator learn from it
+    allocation_path: str | None = None  # `path` from /ai-invoice/allocate; heuristic splits aren't learned
 
 @app.post("/ai-invoice/finalize")
 async def finalize(req: FinalizeRequest):
     out = finalize_invoice(req.client, req.line_items, req.billing_period)
+    # Totals are known now: draft the email body while the user looks at the invoice
+    from .email import prefetch_email_body
+    prefetch_email_body(out['invoice_id'], out)
+    from .allocator import memory
+    try:
+        await asyncio.to_thread(memory.record, req.client, req.line_items, req.billing_period, req.freeform, req.allocation_path)
+    except Exception:
+        logger.exception("recording allocation failed")
     return out
 
 class SendEmailRequest(BaseModel):
@@ -91,18 +287,45 @@ class SendEmailRequest(BaseModel):
 @app.post("/ai-invoice/send-email")
 async def send_email(req: SendEmailRequest):
     from .email import send_invoice_email
-    from pathlib import Path
-    ROOT = Path(__file__).resolve().parents[1]
-    pdf_path = str(ROOT / 'output' / f"{req.invoice_id}.pdf")
-    result = await send_invoice_email(req.invoice_data, pdf_path, req.recipient_email, req.invoice_data.get('consultant_email', ''))
+    from .pdf import get_invoice_pdf
+    # Same in-memory buffer the download endpoint serves; rendered now if nobody downloaded it yet
+    try:
+        pdf = await asyncio.to_thread(get_invoice_pdf, req.invoice_id)
+    except Exception as e:
+        logger.exception("pdf generation failed invoice=%s", req.invoice_id)
+        return {'status': 'error', 'message': f'PDF generation failed: {e}'}
+    if pdf is None:
+        return {'status': 'error', 'message': f'Invoice not found: {req.invoice_id}'}
+    result = await send_invoice_email(req.invoice_id, req.invoice_data, pdf, req.recipient_email, req.invoice_data.get('consultant_email', ''))
     return result
 
+# PDFs are rendered in memory on first request and cached; matched before the /invoices static mount
+@app.get("/invoices/{rel_path:path}.pdf")
+def invoice_pdf(rel_path: str):
+    from fastapi.responses import StreamingResponse
+    from .pdf import get_invoice_pdf
+    invoice_id = Path(rel_path).name
+    try:
+        pdf = get_invoice_pdf(invoice_id)
+    except Exception:
+        logger.exception("pdf generation failed invoice=%s", invoice_id)
+        return JSONResponse({"error": "PDF generation failed"}, status_code=500)
+    if pdf is None:
+        return JSONResponse({"error": "invoice not found"}, status_code=404)
+    view = memoryview(pdf)
+    chunks = (view[i:i + 65536] for i in range(0, len(view), 65536))
+    return StreamingResponse(
+        chunks,
+        media_type="application/pdf",
+        headers={"Content-Disposition": f'inline; filename="{invoice_id}.pdf"', "Content-Length": str(len(pdf))},
+    )
+
 # Mount static files AFTER API routes so they don't intercept API calls
 # Serve project assets folder for logo (use different path to avoid conflict with Vite /assets)
 app.mount('/static', StaticFiles(directory=str(Path(__file__).resolve().parents[1] / 'assets')), name='static')
 
 # Serve output folder for invoice previews
-app.mount('/invoices', StaticFiles(directory=str(Path(__file__).resolve().parents[1] / 'output')), name='invoices')
+app.mount('/invoices', StaticFiles(directory=str(OUTPUT), check_dir=False), name='invoices')
 
-# Serve built web app at root (catch-all, must be last)
-app.mount('/', StaticFiles(directory=str(Path(__file__).resolve().parents[1] / 'web' / 'dist'), html=True), name='root')
+# Serve built web app at root (catch-all, must be last); the API can start before the UI is built
+app.mount('/', StaticFiles(directory=str(Path(__file__).resolve().parents[1] / 'web' / 'dist'), html=True, check_dir=False), name='root')
@@ -0,0 +1,115 @@
+import os
+import re
+import secrets
+import tempfile
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Iterator
+
+ROOT = Path(__file__).resolve().parents[1]
+# Overridable so load tests and benchmarks don't write into the real output/
+OUTPUT = Path(os.getenv('INVOY_OUTPUT_DIR') or ROOT / 'output')
+
+_CROCKFORD = '0123456789ABCDEFGHJKMNPQRSTVWXYZ'
+_ULID_LEN = 26
+
+
+def new_ulid(now: float | None = None) -> str:
+    """26-char ULID: 48-bit ms timestamp + 80 random bits, Crockford base32, sortable by time."""
+    ms = int((time.time() if now is None else now) * 1000)
+    value = (ms << 80) | secrets.randbits(80)
+    out = []
+    for _ in range(_ULID_LEN):
+        value, r = divmod(value, 32)
+        out.append(_CROCKFORD[r])
+    return ''.join(reversed(out))
+
+
+def ulid_datetime(ulid: str) -> datetime:
+    value = 0
+    for ch in ulid[:10]:
+        value = value * 32 + _CROCKFORD.index(ch)
+    return datetime.fromtimestamp(value / 1000, tz=timezone.utc)
+
+
+def client_key(client: str) -> str:
+    """Filesystem- and URL-safe client slug (jane.doe@acme.com -> jane-doe_acme-com)."""
+    key = client.strip().replace('@', '_').replace('.', '-').replace(' ', '-')
+    return re.sub(r'[^A-Za-z0-9_-]+', '-', key).strip('-') or 'unknown'
+
+
+class ArtifactStore:
+    """Invoice files under `root`, sharded as YYYY/MM/<client>/<invoice_id>.<ext>.
+
+    Invoice ids are `<prefix>-<client key>-<ULID>`, so they are unique across workers
+    and the shard directory can be recomputed from the id alone. Writes go to a temp
+    file in the target directory and are renamed into place, so readers never see a
+    partially written invoice.
+    """
+
+    def __init__(self, root: Path = OUTPUT, url_prefix: str = '/invoices'):
+        self.root = Path(root)
+        self.url_prefix = url_prefix
+
+    def new_invoice_id(self, prefix: str, client: str) -> str:
+        return f'{prefix}-{client_key(client)}-{new_ulid()}'
+
+    def _shard(self, invoice_id: str) -> Path:
+        ulid = invoice_id[-_ULID_LEN:]
+        prefix = invoice_id.split('-', 1)[0]
+        client = invoice_id[len(prefix) + 1:-_ULID_LEN - 1]
+        if not re.fullmatch(r'[A-Za-z0-9_-]+', client or '') or not all(c in _CROCKFORD for c in ulid) or len(invoice_id) <= _ULID_LEN:
+            raise ValueError(f'not a store invoice id: {invoice_id!r}')
+        issued = ulid_datetime(ulid)
+        return Path(f'{issued:%Y}', f'{issued:%m}', client)
+
+    def relpath(self, invoice_id: str, ext: str) -> Path:
+        return self._shard(invoice_id) / f'{invoice_id}.{ext}'
+
+    def path_for(self, invoice_id: str, ext: str) -> Path:
+        return self.root / self.relpath(invoice_id, ext)
+
+    def url_for(self, invoice_id: str, ext: str) -> str:
+        return f'{self.url_prefix}/{self.relpath(invoice_id, ext).as_posix()}'
+
+    @contextmanager
+    def atomic_path(self, invoice_id: str, ext: str) -> Iterator[Path]:
+        """Yield a temp path next to the final file; it is renamed into place on success."""
+        target = self.path_for(invoice_id, ext)
+        target.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=target.parent, prefix=f'.{target.name}.', suffix='.tmp')
+        os.close(fd)
+        try:
+            yield Path(tmp)
+            os.replace(tmp, target)
+        finally:
+            if os.path.exists(tmp):
+                os.unlink(tmp)
+
+    def write_text(self, invoice_id: str, ext: str, text: str) -> Path:
+        with self.atomic_path(invoice_id, ext) as tmp:
+            tmp.write_text(text, encoding='utf-8')
+        return self.path_for(invoice_id, ext)
+
+    def write_bytes(self, invoice_id: str, ext: str, data: bytes) -> Path:
+        with self.atomic_path(invoice_id, ext) as tmp:
+            tmp.write_bytes(data)
+        return self.path_for(invoice_id, ext)
+
+    def find(self, invoice_id: str, ext: str) -> Path | None:
+        """Existing file for an id; falls back to the flat pre-sharding layout."""
+        try:
+            path = self.path_for(invoice_id, ext)
+        except ValueError:
+            path = None
+        if path is not None and path.exists():
+            return path
+        legacy = self.root / f'{invoice_id}.{ext}'
+        if Path(invoice_id).name == invoice_id and legacy.exists():
+            return legacy
+        return None
+
+
+store = ArtifactStore()
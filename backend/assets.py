@@ -0,0 +1,64 @@
+import mimetypes
+from pathlib import Path
+from typing import Dict, Tuple
+from urllib.parse import urlparse, unquote
+from .metrics import cache_result
+
+ROOT = Path(__file__).resolve().parents[1]
+ASSETS = ROOT / 'assets'
+# base_url for rendering invoices. Branding links are written relative to the default output/
+# dir (logoUrl ../assets/logo.png); a base inside assets/ resolves them there wherever
+# INVOY_OUTPUT_DIR points, and bare names (logo.png) too
+BASE_URL = ASSETS.as_uri() + '/'
+
+# In-memory cache of files under assets/, keyed by path and invalidated on mtime change
+_CACHE: Dict[Path, Tuple[float, bytes]] = {}
+
+
+def read_asset(path: Path) -> bytes:
+    """Return the bytes of an asset file, served from memory while its mtime is unchanged."""
+    mtime = path.stat().st_mtime
+    hit = _CACHE.get(path)
+    if hit and hit[0] == mtime:
+        cache_result('assets', True)
+        return hit[1]
+    cache_result('assets', False)
+    data = path.read_bytes()
+    _CACHE[path] = (mtime, data)
+    return data
+
+
+def _resolve_asset(url: str) -> Path | None:
+    # Templates reference the logo as /static/<name> (the web mount) or as a path into assets/
+    parsed = urlparse(url)
+    if parsed.scheme not in ('', 'file'):
+        return None
+    path = unquote(parsed.path)
+    if path.startswith('/static/'):
+        candidate = ASSETS / path[len('/static/'):]
+    else:
+        candidate = Path(path)
+    try:
+        candidate = candidate.resolve()
+        candidate.relative_to(ASSETS)
+    except (OSError, ValueError):
+        return None
+    return candidate if candidate.is_file() else None
+
+
+def asset_url_fetcher(url: str, *args, **kwargs) -> Dict:
+    """WeasyPrint url_fetcher serving assets/ (logo, fonts, CSS) from the in-memory cache.
+
+    Anything outside assets/ falls through to WeasyPrint's default fetcher.
+    """
+    path = _resolve_asset(url)
+    if path is None:
+        from weasyprint import default_url_fetcher
+        return default_url_fetcher(url, *args, **kwargs)
+    mime_type = mimetypes.guess_type(path.name)[0] or 'application/octet-stream'
+    return {
+        'string': read_asset(path),
+        'mime_type': mime_type,
+        'encoding': 'utf-8' if mime_type.startswith('text/') else None,
+        'redirected_url': path.as_uri(),
+    }
@@ -0,0 +1,171 @@
+import asyncio
+import logging
+import os
+from typing import Dict, List
+from urllib.parse import quote
+
+logger = logging.getLogger(__name__)
+
+# Overridable so benchmarks and load tests can point at a local stub
+GOOGLE_API_BASE = os.getenv("GOOGLE_API_BASE", "https://www.googleapis.com")
+# Max calendars fetched at once per request
+CALENDAR_FANOUT = int(os.getenv("CALENDAR_FANOUT", "4"))
+# Pass `q` (a raw attendee email, see calender_routes._server_query) to the API's
+# token-based search. The local filter still runs afterwards; set to 0 to filter locally only.
+CALENDAR_SERVER_SEARCH = os.getenv("CALENDAR_SERVER_SEARCH", "1") != "0"
+
+# Partial responses: only what the export, billing and dedup actually read
+EVENT_FIELDS = (
+    "nextPageToken,updated,"
+    "items(id,iCalUID,summary,description,start,end,status,attendees(email,displayName))"
+)
+CALENDAR_LIST_FIELDS = "nextPageToken,items(id,primary,selected)"
+# Google only gzips responses when the User-Agent also mentions gzip
+_HEADERS = {"Accept-Encoding": "gzip", "User-Agent": "invoy-backend (gzip)"}
+
+
+class CalendarError(Exception):
+    def __init__(self, message: str, details: str = ""):
+        super().__init__(message)
+        self.details = details
+
+
+async def _get_paged(client, url: str, params: Dict, first_page: Dict | None = None) -> List[Dict]:
+    """GET a Calendar API collection, following nextPageToken.
+
+    The first page's top-level fields (e.g. `updated`) are copied into `first_page`.
+    """
+    items: List[Dict] = []
+    params = dict(params)
+    while True:
+        resp = await client.get(url, params=params)
+        if resp.status_code != 200:
+            raise CalendarError(f"Calendar API returned {resp.status_code} for {url}", resp.text)
+        body = resp.json()
+        if first_page is not None and "pageToken" not in params:
+            first_page.update((k, v) for k, v in body.items() if k not in ("items", "nextPageToken"))
+        items.extend(body.get("items", []))
+        token = body.get("nextPageToken")
+        if not token:
+            return items
+        params["pageToken"] = token
+
+
+async def list_calendars(client) -> List[str]:
+    """Ids of the calendars the user has selected in Google Calendar (primary always included)."""
+    items = await _get_paged(client, f"{GOOGLE_API_BASE}/calendar/v3/users/me/calendarList", {"minAccessRole": "reader", "fields": CALENDAR_LIST_FIELDS})
+    ids = [c["id"] for c in items if c.get("primary") or c.get("selected")]
+    # The primary calendar is listed under the user's email; the API also accepts the alias
+    return ids or ["primary"]
+
+
+def _dedup_key(event: Dict):
+    # Instances of a recurring event share an iCalUID, so include the start time
+    start = event.get("start", {})
+    return event.get("iCalUID") or event.get("id"), start.get("dateTime") or start.get("date")
+
+
+def _start(event: Dict) -> str:
+    start = event.get("start", {})
+    return start.get("dateTime") or start.get("date") or ""
+
+
+def version_tag(versions: Dict[str, str]) -> str:
+    """Stable string for {calendar id: updated}; changes when any calendar changes."""
+    return ",".join(f"{c}={u}" for c, u in sorted(versions.items()))
+
+
+async def calendar_versions(token: str, time_min: str, time_max: str) -> Dict[str, str]:
+    """`updated` (last modification time) of every selected calendar, for cache validation.
+
+    One calendarList call plus one single-item events call per calendar, so it is
+    much cheaper than fetch_events. Raises CalendarError if any calendar fails.
+    """
+    import httpx
+
+    headers = {**_HEADERS, "Authorization": f"Bearer {token}"}
+    params = {"timeMin": time_min, "timeMax": time_max, "maxResults": 1, "fields": "updated"}
+    limit = asyncio.Semaphore(CALENDAR_FANOUT)
+
+    async with httpx.AsyncClient(headers=headers, timeout=30.0) as client:
+        calendar_ids = await list_calendars(client)
+
+        async def one(cal_id: str) -> str:
+            async with limit:
+                url = f"{GOOGLE_API_BASE}/calendar/v3/calendars/{quote(cal_id, safe='')}/events"
+                resp = await client.get(url, params=params)
+            if resp.status_code != 200:
+                raise CalendarError(f"Calendar API returned {resp.status_code} for {url}", resp.text)
+            return resp.json().get("updated", "")
+
+        updated = await asyncio.gather(*(one(c) for c in calendar_ids))
+    return dict(zip(calendar_ids, updated))
+
+
+async def fetch_events(token: str, time_min: str, time_max: str, q: str | None = None,
+                       versions: Dict[str, str] | None = None) -> List[Dict]:
+    """Events from all selected calendars in [time_min, time_max), merged and sorted by start.
+
+    Calendars are queried concurrently (at most CALENDAR_FANOUT at a time). An event
+    that appears in several calendars (e.g. a meeting on a shared team calendar) is
+    returned once. A calendar that fails is skipped unless every calendar fails.
+
+    Only the fields in EVENT_FIELDS are requested, and focus time, out-of-office,
+    working location and deleted events are filtered out by the API. `q` (free-text
+    search, e.g. an attendee email) narrows the results server-side as well.
+
+    If `versions` is given it is filled with each fetched calendar's `updated` time
+    (see calendar_versions).
+    """
+    import httpx
+
+    headers = {**_HEADERS, "Authorization": f"Bearer {token}"}
+    params = {
+        "timeMin": time_min,
+        "timeMax": time_max,
+        "singleEvents": "true",
+        "orderBy": "startTime",
+        "showDeleted": "false",
+        "eventTypes": "default",
+        "maxResults": 2500,
+        "fields": EVENT_FIELDS,
+    }
+    if q and CALENDAR_SERVER_SEARCH:
+        params["q"] = q
+    limit = asyncio.Semaphore(CALENDAR_FANOUT)
+
+    async with httpx.AsyncClient(headers=headers, timeout=30.0) as client:
+        calendar_ids = await list_calendars(client)
+
+        async def fetch_one(cal_id: str) -> List[Dict]:
+            async with limit:
+                url = f"{GOOGLE_API_BASE}/calendar/v3/calendars/{quote(cal_id, safe='')}/events"
+                first: Dict = {}
+                items = await _get_paged(client, url, params, first)
+            if versions is not None:
+                versions[cal_id] = first.get("updated", "")
+            return items
+
+        results = await asyncio.gather(*(fetch_one(c) for c in calendar_ids), return_exceptions=True)
+
+    failures = [(c, r) for c, r in zip(calendar_ids, results) if isinstance(r, BaseException)]
+    for cal_id, err in failures:
+        logger.warning("calendar fetch failed calendar=%s error=%s", cal_id, err)
+    if failures and len(failures) == len(calendar_ids):
+        err = failures[0][1]
+        raise err if isinstance(err, CalendarError) else CalendarError(str(err))
+
+    seen = set()
+    merged: List[Dict] = []
+    for events in results:
+        if isinstance(events, BaseException):
+            continue
+        for ev in events:
+            key = _dedup_key(ev)
+            if key in seen:
+                continue
+            seen.add(key)
+            merged.append(ev)
+    merged.sort(key=_start)
+    logger.info("calendar fan-out calendars=%d events=%d", len(calendar_ids), len(merged))
+    return merged
@@ -1,21 +1,29 @@
 import os
 import json
-import requests
+import re
+import asyncio
+import logging
 from datetime import datetime
-from fastapi import APIRouter, Request, Query, Depends
+from fastapi import APIRouter, Request, Query
 from fastapi.responses import RedirectResponse, JSONResponse
-from google_auth_oauthlib.flow import Flow
-from google.oauth2.credentials import Credentials
-from sqlalchemy.orm import Session
-from dotenv import load_dotenv
-from google.auth.transport.requests import Request as GoogleRequest
-from scripts.generate_invoices import generate_my_invoice
-from backend.db import UserToken, SessionLocal
+from backend.metrics import timed
+from backend.profiling import ProfilingRoute
+from backend.calendar_client import GOOGLE_API_BASE
+from backend.singleflight import SingleFlightCache
 
-# Load env
-load_dotenv()
+# google-auth, requests, SQLAlchemy and the invoice generator are imported inside
+# the handlers so importing the app stays cheap (see backend/startup.py).
+# .env is loaded by backend.app before this module is imported.
 
-router = APIRouter()
+logger = logging.getLogger(__name__)
+
+router = APIRouter(route_class=ProfilingRoute)
+
+# Identical invoice requests within the TTL are answered from memory; after that the
+# calendars' `updated` times are checked before anything is fetched or rendered again
+CALENDAR_CACHE_TTL = float(os.getenv("CALENDAR_CACHE_TTL", "60"))
+CALENDAR_CACHE_MAX_AGE = float(os.getenv("CALENDAR_CACHE_MAX_AGE", "900"))
+calendar_invoices = SingleFlightCache("calendar_invoice", CALENDAR_CACHE_TTL, CALENDAR_CACHE_MAX_AGE)
 
 CLIENT_ID = os.getenv("GOOGLE_CLIENT_ID")
 CLIENT_SECRET = os.getenv("GOOGLE_CLIENT_SECRET")
@@ -32,7 +40,8 @@ SCOPES = [
 # ---------- AUTH FLOW ----------
 @router.get("/auth/login")
 def login():
-    print("🔹 Starting OAuth flow...")
+    from google_auth_oauthlib.flow import Flow
+    logger.info("starting oauth flow")
     flow = Flow.from_client_config(
         {
             "web": {
@@ -57,6 +66,9 @@ def login():
 @router.get("/auth/callback")
 def callback(request: Request):
     """Handle Google callback and store tokens in DB."""
+    import requests
+    from google_auth_oauthlib.flow import Flow
+    from backend.db import UserToken, SessionLocal
     code = request.query_params.get("code")
     flow = Flow.from_client_config(
         {
@@ -76,7 +88,7 @@ def callback(request: Request):
 
     # Fetch user info
     user_info = requests.get(
-        "https://www.googleapis.com/oauth2/v2/userinfo",
+        f"{GOOGLE_API_BASE}/oauth2/v2/userinfo",
         headers={"Authorization": f"Bearer {creds.token}"}
     ).json()
     email = user_info.get("email")
@@ -99,12 +111,15 @@ def callback(request: Request):
     db.commit()
     db.close()
 
-    print(f"✅ Tokens saved for {email}")
+    logger.info("tokens saved email=%s", email)
     return JSONResponse({"message": f"Login successful for {email}!"})
 
 
 # ---------- TOKEN HELPER ----------
 def load_credentials(email: str):
+    from google.oauth2.credentials import Credentials
+    from google.auth.transport.requests import Request as GoogleRequest
+    from backend.db import UserToken, SessionLocal
     db = SessionLocal()
     if email is None:
         user = db.query(UserToken).order_by(UserToken.id.desc()).first()
@@ -114,7 +129,7 @@ def load_credentials(email: str):
     if not user:
         raise Exception(f"No tokens found for {email}. Please authenticate first.")
     db.close()
-    print(f"🔹 Loading tokens for {email}...")
+    logger.debug("loading tokens email=%s", email)
     creds_data = {
         "token": user.access_token,
         "refresh_token": user.refresh_token,
@@ -123,13 +138,14 @@ def load_credentials(email: str):
         "client_secret": user.client_secret,
         "scopes": json.loads(user.scopes),
     }
-    print(f"♻️ Loading credentials for {creds_data}...")
-
+    # Without the stored expiry google-auth treats the token as expired and refreshes every call
+    if user.expiry:
+        creds_data["expiry"] = user.expiry.isoformat()
     creds = Credentials.from_authorized_user_info(creds_data)
 
     if not creds.valid:
         if creds.expired and creds.refresh_token:
-            print(f"♻️ Refreshing token for {email}...")
+            logger.info("refreshing token email=%s", email)
             creds.refresh(GoogleRequest())
             db = SessionLocal()
             user = db.query(UserToken).filter(UserToken.email == email).first()
@@ -137,7 +153,7 @@ def load_credentials(email: str):
             user.expiry = creds.expiry
             db.commit()
             db.close()
-            print(f"✅ Token refreshed for {email}")
+            logger.info("token refreshed email=%s", email)
         else:
             raise Exception("Credentials invalid or missing refresh token.")
 
@@ -169,7 +185,7 @@ def get_min_max_time(periodLabel):
             start_time = datetime.strptime(start_str, "%Y-%m-%d").isoformat() + "Z"
             end_time = datetime.strptime(end_str, "%Y-%m-%d").isoformat() + "Z"
         except ValueError:
-            print(f"⚠️ Invalid periodLabel format: {periodLabel} (expected YYYY-MM-DD:YYYY-MM-DD)")
+            logger.warning("invalid periodLabel=%r (expected YYYY-MM-DD:YYYY-MM-DD)", periodLabel)
 
     # Use provided start/end times, or default to the first and last day of the month
     if start_time and end_time:
@@ -183,151 +199,131 @@ def get_min_max_time(periodLabel):
             else datetime(year, month + 1, 1).isoformat() + "Z"
         )
 
-    print("🕓 time_min:", time_min)
-    print("🕓 time_max:", time_max)
+    logger.debug("period time_min=%s time_max=%s", time_min, time_max)
 
     return time_min, time_max
 
 # ---------- CALENDAR ----------
 @router.get("/calendar/events")
-def get_calendar_events(
+async def get_calendar_events(
     attendee: str = Query(..., description="Attendee email to fetch calendar"),  # required
     periodLabel: str = Query(..., description="Time period label"),  # ✅ now str not int
     email: str = Query(None, description="Optional user email"),  # optional if needed
-    save_to_file: bool = Query(True, description="Save results to events.txt")
+    save_to_file: bool = Query(True, description="Export billed events (NDJSON/Parquet, see backend/exports.py)")
 ):
-    # try:
-        credentials = load_credentials(email)
-        headers = {"Authorization": f"Bearer {credentials.token}"}
-
-        print(f"🔹 Fetching calendar events for {periodLabel}...")
-        time_min, time_max = get_min_max_time(periodLabel)
-        print("🕓 time_min:", time_min, time_max)
-        params = {"timeMin": time_min, "timeMax": time_max, "singleEvents": True, "orderBy": "startTime"}
-        response = requests.get(
-            "https://www.googleapis.com/calendar/v3/calendars/primary/events",
-            headers=headers,
-            params=params
-        )
-
-        if response.status_code != 200:
-            print("❌ [ERROR] Calendar API failed:", response.text)
-            return {"error": "Failed to fetch events", "details": response.text}
-
-        events = response.json().get("items", [])
-        print(f"✅ [CALENDAR] Retrieved {len(events)} total events.")
-
-        # # Removed Filtering for business-related events for broader use case
-        # keywords = ["meeting", "business", "sync", "client", "review", "kickoff"]
-        # filtered = [e for e in events if any(kw in e.get("summary", "").lower() for kw in keywords)]
-        
-        filtered = events
-        print(f"🔹 [FILTER] Found {len(filtered)} business-related events.")
-
-        if attendee:
-            filtered = [
-                e for e in filtered
-                if "attendees" in e and any(
-                    attendee.lower() in a.get("email", "").lower()
-                    for a in e["attendees"]
-                )
-            ]
-            print(f"🔹 [FILTER] After attendee filter: {len(filtered)} events remain.")
-
-        print(f"filtered events: {filtered}")
-        filename = "events.txt"
-        is_txt = os.path.splitext(filename)[1].lower() == ".txt"
-        if save_to_file:
-            if not is_txt:
-                event_data = [] # Prepare a list to store event data
-                attendees_list = []
-                for ev in filtered: # Process each event
-                    attendees = ev.get("attendees", [])
-                    if attendees:
-                        attendees_list = [
-                            {
-                                "displayName": a.get("displayName", ""),
-                                "email": a.get("email", "")
-                            }
-                            for a in attendees
-                        ]
-                    event = {
-                        "id": ev.get('id', ''),
-                        "title": ev.get('summary', ''),
-                        "description": ev.get('description', ''),
-                        "start": ev.get("start", {}).get("dateTime", ev.get("start", {}).get("date")),
-                        "end": ev.get("end", {}).get("dateTime", ev.get("end", {}).get("date")),
-                        "status": ev.get('status', ''),
-                        "attendees": attendees_list
-                    }
-                    event_data.append(event)
-
-                # Write to JSON file (compact format)
-                events_filename = 'events.json'
-                with open(events_filename, 'w') as f:
-                    json.dump(event_data, f, separators=(',', ':'))
-                print(f"💾 [WRITE] Saved {len(filtered)} events to {events_filename}")
-            else:
-                with open('events.txt', 'w') as f:
-                    billing_period = periodLabel.replace(":", " to ")
-                    f.write(f"Calendar export - Billing Period: {billing_period}\n")
-                    f.write("Timezone: America/Boston\n")
-                    f.write("Source: Google Calendar API (simulated)\n")
-                    for ev in filtered:
-                        f.write("Event:\n")
-                        f.write(f"  id: {ev.get('id', '-')}\n")
-                        f.write(f"  title: {ev.get('summary', '-')}\n")
-                        f.write(f"  description: {ev.get('description', '-')}\n")
-                        start = ev.get("start", {}).get("dateTime", ev.get("start", {}).get("date"))
-                        end = ev.get("end", {}).get("dateTime", ev.get("end", {}).get("date"))
-                        f.write(f"  start: {start}\n")
-                        f.write(f"  end: {end}\n")
-                        f.write(f"  status: {ev.get('status', '')}\n")
-                        attendees = ev.get("attendees", [])
-                        if attendees:
-                            f.write(f"  attendees:\n")
-                            for a in attendees:
-                                f.write(f"    - name: {a.get('displayName', '_')}\n")
-                                f.write(f"      email: {a.get('email', '')}\n")
-                        f.write("\n")
-                print(f"💾 [WRITE] Saved {len(filtered)} events to events.txt")
-        print(f"Saving file: {filename}")  
-        out, duration_hours, rate = generate_my_invoice(filename)
-
-        # return {
-        #     "total": len(filtered),
-        #     "saved_to": "events.txt" if save_to_file else None,
-        #     "filters": {"month": month, "year": year, "attendee": attendee},
-        #     "events": filtered
-        # }
-    
-        # Convert absolute path to relative path for frontend
-        invoice_filename = out.name  # Get just the filename
-        invoice_relative_path = f"/invoices/{invoice_filename}"
-        
-        # Fake data for testing
-        data = {
-            "totalH": duration_hours,
-            "hourly": rate,
-            "invoicePath": invoice_relative_path,
-            "attendee": attendee,
-            "periodLabel": periodLabel,
-        }
-        # Return as JSON (explicitly)
-        print("data", data)
+    # Double clicks and retries share one computation, and the result is reused while
+    # the calendars are unchanged (see backend/singleflight.py)
+    # Keyed on the account actually used, so a request without `email` can't be served
+    # another account's cached invoice after a different user logs in
+    account = await asyncio.to_thread(_account_email, email)
+    if account is None:
+        data, _ = await _calendar_invoice(attendee, periodLabel, email, save_to_file)
         return JSONResponse(content=data)
-    # except Exception as e:
-    #     print("❌ [ERROR] Calendar event fetch failed:", e)
-    #     return JSONResponse({"error": str(e)}, status_code=500)
-    
-        # # Fake data for testing
-        # data = {
-        #     "totalH": 12.5,
-        #     "hourly": 200,
-        #     "invoicePath": "/invoices/sample.pdf",
-        #     "attendee": attendee,
-        #     "periodLabel": periodLabel,
-        # }
-        # # Return as JSON (explicitly)
-        # return JSONResponse(content=data)
+    key = (account, attendee.strip().lower(), periodLabel, save_to_file)
+    data = await calendar_invoices.run(
+        key,
+        lambda: _calendar_invoice(attendee, periodLabel, account, save_to_file),
+        lambda: _calendar_version(account, periodLabel),
+    )
+    return JSONResponse(content=data)
+
 
+def _account_email(email):
+    """Email of the account load_credentials(email) uses: the latest login when none is given."""
+    if email:
+        return email
+    from backend.db import UserToken, SessionLocal
+    db = SessionLocal()
+    try:
+        user = db.query(UserToken).order_by(UserToken.id.desc()).first()
+        return user.email if user else None
+    finally:
+        db.close()
+
+
+async def _calendar_version(email, periodLabel):
+    from backend.calendar_client import calendar_versions, version_tag
+    credentials = await asyncio.to_thread(load_credentials, email)
+    time_min, time_max = get_min_max_time(periodLabel)
+    return version_tag(await calendar_versions(credentials.token, time_min, time_max))
+
+
+async def _calendar_invoice(attendee, periodLabel, email, save_to_file):
+    """(response data, calendar version); the version is None for errors so they aren't cached."""
+    from backend.calendar_client import fetch_events, version_tag, CalendarError
+    credentials = await asyncio.to_thread(load_credentials, email)
+
+    logger.info("fetching calendar events period=%s", periodLabel)
+    time_min, time_max = get_min_max_time(periodLabel)
+    versions = {}
+    try:
+        # All selected calendars (primary, secondary, shared), fetched concurrently
+        with timed("calendar_fetch"):
+            q = await asyncio.to_thread(_server_query, attendee)
+            events = await fetch_events(credentials.token, time_min, time_max, q=q, versions=versions)
+    except CalendarError as e:
+        logger.error("calendar api failed: %s body=%s", e, e.details)
+        return {"error": "Failed to fetch events", "details": e.details or str(e)}, None
+
+    logger.info("calendar retrieved events=%d", len(events))
+
+    filtered = events
+    if attendee:
+        # Resolved through the client directory, same as billing (backend/clients.py)
+        filtered = await asyncio.to_thread(_filter_by_attendee, filtered, attendee)
+        logger.info("attendee filter kept events=%d", len(filtered))
+
+    # File export and invoice rendering are blocking; keep them off the event loop
+    data = await asyncio.to_thread(_export_and_invoice, filtered, attendee, periodLabel, save_to_file)
+    return data, version_tag(versions)
+
+
+def _server_query(attendee):
+    """`q` for Google's search, or None to filter locally only.
+
+    Google matches whole tokens, so a client name, alias or domain would drop events the
+    directory-based filter below should keep. Only a raw email that isn't a known client
+    (whose other contacts and domains also bill) is safe to search for.
+    """
+    from backend.clients import get_directory
+    a = (attendee or "").strip()
+    if "@" not in a or " " in a or get_directory().lookup(a) is not None:
+        return None
+    return a
+
+
+def _filter_by_attendee(events, attendee):
+    from backend.clients import filter_events
+    from scripts.generate_invoices import load_config
+    consultant, _, _ = load_config()
+    return filter_events(events, attendee, consultant["email"])
+
+
+def _export_and_invoice(filtered, attendee, periodLabel, save_to_file):
+    from contextlib import nullcontext
+    from backend.artifacts import store
+    from backend.exports import EventExport
+    from scripts.generate_invoices import Event, generate_invoice_for_events, load_config
+    # Billed straight from the API events; nothing is written to the working directory
+    events = [Event.from_api(ev) for ev in filtered if ev.get("start") and ev.get("end")]
+    m = re.fullmatch(r"(\d{4}-\d{2}-\d{2}):(\d{4}-\d{2}-\d{2})", periodLabel or "")
+    period = m.groups() if m else ()
+    export = None
+    if save_to_file:
+        consultant, _, _ = load_config()
+        # Billed events go to exports/consultant=<key>/month=<YYYY-MM>/ as they're billed
+        export = EventExport(consultant["email"])
+    with export or nullcontext():
+        out, duration_hours, rate = generate_invoice_for_events(events, *period, export=export)
+
+    data = {
+        "totalH": duration_hours,
+        "hourly": rate,
+        # Relative URL for the frontend; no billable events means no invoice
+        "invoicePath": store.url_for(out.stem, 'html') if out else None,
+        "attendee": attendee,
+        "periodLabel": periodLabel,
+        "exportedEvents": export.rows if export else 0,
+    }
+    logger.debug("calendar invoice data=%s", data)
+    return data
@@ -0,0 +1,218 @@
+import json
+import logging
+import threading
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from .artifacts import client_key
+
+logger = logging.getLogger(__name__)
+
+ROOT = Path(__file__).resolve().parents[1]
+CONFIG = ROOT / 'data' / 'config.json'
+
+# Match strength, best first. Used to pick one client for multi-party meetings.
+EXACT, ALIAS, DOMAIN = 0, 1, 2
+
+
+@dataclass(frozen=True)
+class Client:
+    key: str
+    name: str
+    email: str = ''
+    company: Optional[str] = None
+    hourly_rate: Optional[float] = None
+    emails: Tuple[str, ...] = ()
+    domains: Tuple[str, ...] = ()
+    aliases: Tuple[str, ...] = ()
+
+    def as_invoice_client(self) -> Dict:
+        """The dict shape the invoice templates and generator use."""
+        return {'name': self.name, 'email': self.email, 'company': self.company,
+                'key': self.key, 'hourlyRate': self.hourly_rate}
+
+
+def _domain_suffixes(domain: str) -> Iterable[str]:
+    # mail.eu.acme.com -> mail.eu.acme.com, eu.acme.com, acme.com
+    parts = domain.split('.')
+    for i in range(len(parts) - 1):
+        yield '.'.join(parts[i:])
+
+
+class ClientDirectory:
+    """Known clients indexed by exact email, alias and domain.
+
+    Every lookup is a dict hit per attendee (plus one per parent domain), so resolving
+    an event is O(attendees) regardless of directory size.
+    """
+
+    def __init__(self, clients: Iterable[Client] = ()):
+        self.clients: Dict[str, Client] = {}
+        self._by_email: Dict[str, Client] = {}
+        self._by_alias: Dict[str, Client] = {}
+        self._by_domain: Dict[str, Client] = {}
+        for c in clients:
+            self.add(c)
+
+    def __len__(self):
+        return len(self.clients)
+
+    def add(self, client: Client) -> None:
+        self.clients[client.key] = client
+        for index, values in ((self._by_email, (client.email, *client.emails)),
+                              (self._by_alias, (client.key, client.name, client.company or '', *client.aliases)),
+                              (self._by_domain, client.domains)):
+            for v in values:
+                v = v.strip().lower()
+                if not v:
+                    continue
+                other = index.get(v)
+                # Same value claimed twice: keep the lowest key so resolution doesn't depend on load order
+                if other is not None and other.key != client.key:
+                    logger.warning("client directory: %r claimed by %s and %s", v, other.key, client.key)
+                    if other.key < client.key:
+                        continue
+                index[v] = client
+
+    def match_email(self, email: str) -> Optional[Tuple[int, Client]]:
+        """(strength, client) for one attendee email, or None if unknown."""
+        email = (email or '').strip().lower()
+        if not email:
+            return None
+        if email in self._by_email:
+            return EXACT, self._by_email[email]
+        if email in self._by_alias:
+            return ALIAS, self._by_alias[email]
+        domain = email.rpartition('@')[2]
+        for d in _domain_suffixes(domain):
+            if d in self._by_domain:
+                return DOMAIN, self._by_domain[d]
+        return None
+
+    def lookup(self, query: str) -> Optional[Client]:
+        """Client for a free-form query: email, alias, client key, company name or domain."""
+        q = (query or '').strip().lower()
+        if not q:
+            return None
+        if q in self._by_alias:
+            return self._by_alias[q]
+        hit = self.match_email(q if '@' in q else f'@{q}')
+        return hit[1] if hit else None
+
+    def resolve(self, attendees: List[Dict], consultant_email: str) -> Optional[Client]:
+        """The client an event bills to.
+
+        Ties between several matching clients go to the strongest match (exact email,
+        then alias, then domain) and then to the lowest client key, so a meeting with
+        two clients always lands on the same invoice.
+        """
+        me = (consultant_email or '').lower()
+        best = None
+        for a in attendees:
+            email = (a.get('email') or '').lower()
+            if not email or email == me:
+                continue
+            hit = self.match_email(email)
+            if hit and (best is None or (hit[0], hit[1].key) < (best[0], best[1].key)):
+                best = hit
+        return best[1] if best else None
+
+
+def _client_from_dict(d: Dict) -> Client:
+    email = (d.get('email') or '').strip()
+    name = d.get('name') or d.get('company') or email
+    rate = d.get('hourlyRate')
+    return Client(
+        key=d.get('key') or client_key(name),
+        name=name,
+        email=email,
+        company=d.get('company'),
+        hourly_rate=float(rate) if rate is not None else None,
+        emails=tuple(d.get('emails') or ()),
+        domains=tuple(d.get('domains') or ()),
+        aliases=tuple(d.get('aliases') or ()),
+    )
+
+
+def _load_config_clients(path: Path) -> List[Client]:
+    try:
+        cfg = json.loads(path.read_text())
+    except (OSError, ValueError) as e:
+        logger.warning("client directory: cannot read %s: %s", path, e)
+        return []
+    return [_client_from_dict(d) for d in cfg.get('clients', [])]
+
+
+def _load_db_clients() -> List[Client]:
+    try:
+        from .db import SessionLocal, ClientRecord
+        db = SessionLocal()
+        try:
+            rows = db.query(ClientRecord).all()
+        finally:
+            db.close()
+    except Exception as e:
+        logger.warning("client directory: DB clients unavailable: %s", e)
+        return []
+    return [_client_from_dict(r.as_dict()) for r in rows]
+
+
+_lock = threading.Lock()
+_cache: Dict[Tuple, ClientDirectory] = {}
+
+
+def get_directory(use_db: bool = True, config_path: Path = CONFIG) -> ClientDirectory:
+    """Client directory from data/config.json `clients` plus the DB `clients` table.
+
+    Built once and reused until config.json changes. DB rows override config
+    entries with the same key. Call `reload_directory()` after editing DB clients.
+    """
+    try:
+        mtime = config_path.stat().st_mtime_ns
+    except OSError:
+        mtime = None
+    cache_key = (str(config_path), mtime, use_db)
+    with _lock:
+        directory = _cache.get(cache_key)
+        if directory is None:
+            clients = {c.key: c for c in _load_config_clients(config_path)}
+            if use_db:
+                clients.update((c.key, c) for c in _load_db_clients())
+            directory = ClientDirectory(sorted(clients.values(), key=lambda c: c.key))
+            _cache.clear()
+            _cache[cache_key] = directory
+            logger.info("client directory loaded clients=%d", len(directory))
+        return directory
+
+
+def reload_directory() -> None:
+    with _lock:
+        _cache.clear()
+
+
+def filter_events(events: List[Dict], attendee: str, consultant_email: str,
+                  directory: Optional[ClientDirectory] = None) -> List[Dict]:
+    """Calendar events that belong to `attendee` (a client name, email or domain).
+
+    A known client keeps the events that resolve to it, which is the same rule
+    billing uses, so a meeting is never billed to two clients. An unknown email or
+    domain matches attendees exactly, or by domain. When that finds nothing (or for
+    anything else, e.g. a dotted local part like "jane.doe") it falls back to a
+    substring match on attendee emails.
+    """
+    directory = directory if directory is not None else get_directory()
+    target = directory.lookup(attendee)
+    if target is not None:
+        return [e for e in events
+                if (c := directory.resolve(e.get('attendees', []), consultant_email)) is not None and c.key == target.key]
+    needle = attendee.strip().lower().lstrip('@')
+
+    def matching(hit):
+        return [e for e in events if any(hit((a.get('email') or '').lower()) for a in e.get('attendees', []))]
+
+    if '@' in needle or '.' in needle:
+        exact = matching(lambda email: email == needle or needle in _domain_suffixes(email.rpartition('@')[2]))
+        if exact:
+            return exact
+    return matching(lambda email: needle in email)
@@ -1,13 +1,13 @@
-import os
 import json
+import threading
 from datetime import datetime
-from sqlalchemy import create_engine, Column, Integer, String, DateTime
+from sqlalchemy import create_engine, Column, Integer, String, DateTime, Float
 from sqlalchemy.orm import declarative_base, sessionmaker
 
 # Database setup
 Base = declarative_base()
 engine = create_engine("sqlite:///tokens.db", echo=False)
-SessionLocal = sessionmaker(bind=engine)
+_Session = sessionmaker(bind=engine)
 
 class UserToken(Base):
     __tablename__ = "user_tokens"
@@ -22,7 +22,62 @@ class UserToken(Base):
     expiry = Column(DateTime)
     scopes = Column(String)
 
-Base.metadata.create_all(bind=engine)
+class ClientRecord(Base):
+    """Client directory entries (see backend/clients.py); list columns hold JSON arrays."""
+    __tablename__ = "clients"
+
+    id = Column(Integer, primary_key=True, index=True)
+    key = Column(String, unique=True, nullable=False)
+    name = Column(String, nullable=False)
+    email = Column(String)
+    company = Column(String)
+    hourly_rate = Column(Float)
+    emails = Column(String, default="[]")
+    domains = Column(String, default="[]")
+    aliases = Column(String, default="[]")
+
+    def as_dict(self):
+        return {
+            "key": self.key, "name": self.name, "email": self.email, "company": self.company,
+            "hourlyRate": self.hourly_rate, "emails": json.loads(self.emails or "[]"),
+            "domains": json.loads(self.domains or "[]"), "aliases": json.loads(self.aliases or "[]"),
+        }
+
+class AllocationRecord(Base):
+    """Finalized hour allocations, used by backend/allocator.py to skip Claude for recurring work."""
+    __tablename__ = "allocations"
+
+    id = Column(Integer, primary_key=True, index=True)
+    client = Column(String, nullable=False)
+    client_key = Column(String, index=True)
+    text = Column(String, nullable=False)
+    line_items = Column(String, nullable=False)  # JSON list of {subject, estimated_hours, justification}
+    total_hours = Column(Float)
+    billing_period = Column(String)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+    def as_entry(self):
+        return {
+            "id": self.id, "client": self.client, "text": self.text,
+            "line_items": json.loads(self.line_items), "total_hours": self.total_hours,
+            "billing_period": self.billing_period or "Monthly",
+        }
+
+_initialized = False
+_init_lock = threading.Lock()
+
+def init_db():
+    """Create tables on first use instead of at import time."""
+    global _initialized
+    # Startup warmers call this from several threads at once
+    with _init_lock:
+        if not _initialized:
+            Base.metadata.create_all(bind=engine)
+            _initialized = True
+
+def SessionLocal():
+    init_db()
+    return _Session()
 
 # Utility to get session
 def get_db():
@@ -1,85 +1,158 @@
 import os
+import asyncio
+import hashlib
+import json
+import logging
 import resend
-from pathlib import Path
 from typing import Dict
 import base64
+from .artifacts import store
+from .metrics import timed, cache_result
+
+logger = logging.getLogger(__name__)
 
 # Initialize Resend with API key from env
 resend.api_key = os.getenv('RESEND_API_KEY')
 
-async def send_invoice_email(invoice_data: Dict, pdf_path_str: str, recipient_email: str, consultant_email: str) -> Dict:
-    """Send invoice via Resend with AI-generated email body"""
-    print(f"\n{'='*60}")
-    print(f"📧 EMAIL SENDING ATTEMPT")
-    print(f"{'='*60}")
-    
+
+# ---------- speculative email bodies ----------
+# Finalize starts generating the email body right away; send-email then picks up the
+# finished draft (or awaits the one in flight) instead of calling Claude itself.
+# Drafts are saved next to the invoice as <invoice id>.email.json.
+
+_drafts: Dict[str, asyncio.Task] = {}
+
+
+def draft_fingerprint(invoice_id: str, invoice_data: Dict) -> str:
+    """Hash of the invoice fields generate_email_body uses; a changed work_summary changes it."""
+    inputs = {
+        'invoice_id': invoice_id,
+        'client_name': invoice_data.get('client_name'),
+        'billing_period': invoice_data.get('billing_period'),
+        'total_hours': f"{float(invoice_data.get('total_hours') or 0):.2f}",
+        'total_cost': f"{float(invoice_data.get('total_cost') or 0):.2f}",
+        'tasks': len(invoice_data.get('line_items') or []),
+        'work_summary': (invoice_data.get('work_summary') or '').strip(),
+    }
+    return hashlib.sha256(json.dumps(inputs, sort_keys=True).encode()).hexdigest()[:16]
+
+
+def _load_draft(invoice_id: str, fingerprint: str) -> str | None:
+    path = store.find(invoice_id, 'email.json')
+    if path is None:
+        return None
+    try:
+        draft = json.loads(path.read_text(encoding='utf-8'))
+    except (OSError, ValueError):
+        return None
+    return draft.get('html') if draft.get('fingerprint') == fingerprint else None
+
+
+def _save_draft(invoice_id: str, fingerprint: str, body: str) -> None:
+    # Best effort: pre-sharding invoice ids have no store path, and a failed write only costs a regeneration
+    try:
+        store.write_text(invoice_id, 'email.json', json.dumps({'fingerprint': fingerprint, 'html': body}))
+    except (ValueError, OSError) as e:
+        logger.info("email draft not saved invoice=%s: %s", invoice_id, e)
+
+
+async def _generate_draft(invoice_id: str, invoice_data: Dict, fingerprint: str) -> str:
+    from .ai import generate_email_body
+    body = await generate_email_body(invoice_data)
+    await asyncio.to_thread(_save_draft, invoice_id, fingerprint, body)
+    logger.debug("email draft ready invoice=%s chars=%d", invoice_id, len(body))
+    return body
+
+
+def _start_draft(invoice_id: str, invoice_data: Dict, fingerprint: str) -> asyncio.Task:
+    key = f"{invoice_id}:{fingerprint}"
+    task = asyncio.ensure_future(_generate_draft(invoice_id, dict(invoice_data), fingerprint))
+    _drafts[key] = task
+
+    def done(t):
+        if _drafts.get(key) is t:
+            del _drafts[key]
+        if not t.cancelled() and t.exception() is not None:
+            logger.warning("email draft failed invoice=%s: %s", invoice_id, t.exception())
+    task.add_done_callback(done)
+    return task
+
+
+def prefetch_email_body(invoice_id: str, invoice_data: Dict) -> None:
+    """Start generating the email body for a just-finalized invoice in the background."""
+    fingerprint = draft_fingerprint(invoice_id, invoice_data)
+    if f"{invoice_id}:{fingerprint}" not in _drafts:
+        _start_draft(invoice_id, invoice_data, fingerprint)
+
+
+async def get_email_body(invoice_id: str, invoice_data: Dict) -> str:
+    """The drafted body if its inputs are unchanged, else a freshly generated one.
+
+    `invoice_id` must be a server-side id (e.g. checked by loading its PDF); the id inside
+    the client-supplied `invoice_data` is not trusted for file paths.
+    """
+    fingerprint = draft_fingerprint(invoice_id, invoice_data)
+    task = _drafts.get(f"{invoice_id}:{fingerprint}")
+    if task is not None:
+        try:
+            body = await asyncio.shield(task)
+            cache_result('email_draft', True)
+            return body
+        except Exception:
+            pass  # regenerate below
+    body = await asyncio.to_thread(_load_draft, invoice_id, fingerprint)
+    if body is not None:
+        cache_result('email_draft', True)
+        return body
+    cache_result('email_draft', False)
+    return await _start_draft(invoice_id, invoice_data, fingerprint)
+
+
+async def send_invoice_email(invoice_id: str, invoice_data: Dict, pdf: bytes, recipient_email: str, consultant_email: str) -> Dict:
+    """Send invoice `invoice_id` via Resend with AI-generated email body; `pdf` is the rendered invoice."""
     api_key = os.getenv('RESEND_API_KEY')
     if not api_key:
-        print("❌ RESEND_API_KEY not set in environment")
+        logger.error("RESEND_API_KEY not set in environment")
         return {'status': 'error', 'message': 'RESEND_API_KEY not configured'}
     
-    print(f"✓ Resend API key found: {api_key[:10]}...")
-    
     try:
-        # Construct full path
-        ROOT = Path(__file__).resolve().parents[1]
-        pdf_file = ROOT / 'output' / Path(pdf_path_str).name if not Path(pdf_path_str).is_absolute() else Path(pdf_path_str)
-        
-        print(f"📎 PDF path: {pdf_file}")
-        if not pdf_file.exists():
-            print(f"❌ PDF file not found!")
-            return {'status': 'error', 'message': f'PDF file not found: {pdf_file}'}
-        
-        print(f"✓ PDF file exists ({pdf_file.stat().st_size} bytes)")
-        
-        # Generate personalized email body using Claude
-        print("✍️  Generating email body with Claude...")
-        from .ai import generate_email_body
-        email_body = await generate_email_body(invoice_data)
-        print(f"✓ Email body generated ({len(email_body)} chars)")
+        # Personalized email body from Claude, usually already drafted at finalize
+        email_body = await get_email_body(invoice_id, invoice_data)
+        logger.debug("email body ready chars=%d", len(email_body))
         
         # Send email via Resend
         from_email = os.getenv('RESEND_FROM_EMAIL', 'onboarding@resend.dev')
         
         # Check if domain is verified (if not using resend.dev default)
         if 'resend.dev' not in from_email:
-            print(f"📧 Using verified domain email: {from_email}")
+            logger.debug("using verified sender=%s", from_email)
             actual_recipient = recipient_email
         else:
             # Fallback to testing mode
             verified_email = os.getenv('RESEND_VERIFIED_EMAIL', 'mmqpak2015@gmail.com')
             actual_recipient = verified_email
-            print(f"⚠️  Testing mode: sending to {verified_email} instead of {recipient_email}")
-            print(f"   To send to any email, verify your domain at resend.com/domains")
-        
-        print(f"📨 Sending to: {actual_recipient}")
+            logger.warning("resend testing mode: sending to %s instead of %s (verify your domain at resend.com/domains)", verified_email, recipient_email)
         
         params = {
             "from": f"Invoy <{from_email}>",
             "to": [actual_recipient],
-            "subject": f"Invoice {invoice_data['invoice_id']} — {invoice_data['billing_period']}",
+            "subject": f"Invoice {invoice_id} — {invoice_data['billing_period']}",
             "html": email_body,
             "attachments": [
                 {
-                    "filename": f"{invoice_data['invoice_id']}.pdf",
+                    "filename": f"{invoice_id}.pdf",
                     # Resend expects base64-encoded content string
-                    "content": base64.b64encode(pdf_file.read_bytes()).decode("ascii")
+                    "content": base64.b64encode(pdf).decode("ascii")
                 }
             ]
         }
         
-        print(f"🚀 Calling Resend API...")
-        email = resend.Emails.send(params)
-        print(f"✅ Email sent successfully!")
-        print(f"   Email ID: {email.get('id')}")
-        print(f"   Recipient: {recipient_email}")
-        print(f"{'='*60}\n")
+        with timed("resend_call"):
+            email = resend.Emails.send(params)
+        logger.info("invoice email sent id=%s invoice=%s recipient=%s", email.get('id'), invoice_id, actual_recipient)
         return {'status': 'ok', 'email_id': email.get('id'), 'recipient': recipient_email}
     
     except Exception as e:
-        print(f"❌ Error sending email: {type(e).__name__}: {str(e)}")
-        print(f"{'='*60}\n")
-        import traceback
-        traceback.print_exc()
+        logger.exception("sending invoice email failed")
         return {'status': 'error', 'message': str(e)}
 
@@ -0,0 +1,142 @@
+import json
+import logging
+import os
+from pathlib import Path
+from typing import Dict, Optional
+
+from .artifacts import ROOT, client_key, new_ulid
+
+logger = logging.getLogger(__name__)
+
+# Billed-event exports for the finance warehouse, partitioned as consultant=<key>/month=<YYYY-MM>/
+EXPORT_DIR = Path(os.getenv('INVOY_EXPORT_DIR') or ROOT / 'exports')
+# ndjson, or parquet (needs pyarrow)
+EXPORT_FORMAT = os.getenv('INVOY_EXPORT_FORMAT', 'ndjson').lower()
+# Parquet rows buffered per row group; NDJSON rows are written one by one
+PARQUET_ROW_GROUP = 5000
+
+# Row layout, shared by both formats
+COLUMNS = (
+    ('event_id', 'string'),
+    ('start', 'string'),
+    ('end', 'string'),
+    ('date', 'string'),  # local date of the start, in the consultant's timezone
+    ('subject', 'string'),
+    ('consultant_email', 'string'),
+    ('client_key', 'string'),
+    ('client_name', 'string'),
+    ('client_email', 'string'),
+    ('client_company', 'string'),
+    ('hours', 'double'),
+    ('rate', 'double'),
+    ('amount', 'double'),
+    ('currency', 'string'),
+    ('invoice_id', 'string'),
+    ('period_start', 'string'),
+    ('period_end', 'string'),
+    ('exported_at', 'string'),
+)
+
+
+class _NdjsonPart:
+    suffix = '.ndjson'
+
+    def __init__(self, path: Path):
+        self._f = open(path, 'w', encoding='utf-8')
+
+    def write(self, row: Dict) -> None:
+        self._f.write(json.dumps(row, separators=(',', ':'), ensure_ascii=False) + '\n')
+
+    def close(self) -> None:
+        self._f.close()
+
+
+class _ParquetPart:
+    suffix = '.parquet'
+
+    def __init__(self, path: Path):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        self._pa = pa
+        self._schema = pa.schema([(name, pa.float64() if kind == 'double' else pa.string()) for name, kind in COLUMNS])
+        self._writer = pq.ParquetWriter(str(path), self._schema, compression='zstd')
+        self._rows = []
+
+    def write(self, row: Dict) -> None:
+        self._rows.append(row)
+        if len(self._rows) >= PARQUET_ROW_GROUP:
+            self._flush()
+
+    def _flush(self) -> None:
+        if self._rows:
+            self._writer.write_table(self._pa.Table.from_pylist(self._rows, schema=self._schema))
+            self._rows = []
+
+    def close(self) -> None:
+        self._flush()
+        self._writer.close()
+
+
+class EventExport:
+    """Billed events streamed to partitioned NDJSON or Parquet files as they're billed.
+
+    Layout is <root>/consultant=<key>/month=<YYYY-MM>/part-<ULID>.<ext> (Hive-style, so
+    warehouse loaders read the partition columns from the path). Each export adds one
+    new part per month it touches and never rewrites old parts, so exports can be loaded
+    incrementally; re-exporting a period adds rows with a new invoice_id and exported_at.
+    Parts are written under a dot-prefixed temp name and renamed on close, so a loader
+    never picks up a half-written file.
+    """
+
+    def __init__(self, consultant_email: str, fmt: Optional[str] = None, root: Optional[Path] = None):
+        fmt = (fmt or EXPORT_FORMAT).lower()
+        if fmt not in ('ndjson', 'parquet'):
+            raise ValueError(f"unknown export format {fmt!r} (expected ndjson or parquet)")
+        if fmt == 'parquet':
+            try:
+                import pyarrow.parquet  # noqa: F401
+            except ImportError:
+                logger.warning("pyarrow not installed, exporting NDJSON instead of Parquet")
+                fmt = 'ndjson'
+        self.format = fmt
+        self.root = Path(root or EXPORT_DIR)
+        self.consultant = client_key(consultant_email or 'unknown').lower()
+        self.run_id = new_ulid()
+        self.rows = 0
+        self.paths = []
+        self._parts = {}  # month -> (writer, temp path, final path)
+
+    def write(self, row: Dict) -> None:
+        month = row['date'][:7]
+        part = self._parts.get(month)
+        if part is None:
+            part = self._parts[month] = self._open(month)
+        part[0].write(row)
+        self.rows += 1
+
+    def _open(self, month: str):
+        directory = self.root / f'consultant={self.consultant}' / f'month={month}'
+        directory.mkdir(parents=True, exist_ok=True)
+        part_cls = _ParquetPart if self.format == 'parquet' else _NdjsonPart
+        final = directory / f'part-{self.run_id}{part_cls.suffix}'
+        tmp = directory / f'.{final.name}.tmp'
+        return part_cls(tmp), tmp, final
+
+    def close(self, commit: bool = True) -> None:
+        """Finish every part; without `commit` (e.g. billing failed halfway) they're discarded."""
+        for writer, tmp, final in self._parts.values():
+            writer.close()
+            if commit:
+                os.replace(tmp, final)
+                self.paths.append(final)
+            else:
+                tmp.unlink(missing_ok=True)
+        self._parts.clear()
+        if commit and self.rows:
+            logger.info("exported billed events rows=%d parts=%d format=%s", self.rows, len(self.paths), self.format)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close(commit=exc_type is None)
@@ -0,0 +1,132 @@
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Tuple
+
+# Minimal Prometheus-style registry (text exposition format 0.0.4), no extra dependency
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+_lock = threading.Lock()
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+def _labels(labels: Dict[str, str]) -> Labels:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _fmt(labels: Labels, extra: Tuple[Tuple[str, str], ...] = ()) -> str:
+    pairs = labels + extra
+    if not pairs:
+        return ''
+    body = ','.join('%s="%s"' % (k, v.replace('\\', '\\\\').replace('"', '\\"')) for k, v in pairs)
+    return '{' + body + '}'
+
+
+class Counter:
+    def __init__(self, name: str, doc: str):
+        self.name, self.doc = name, doc
+        self._values: Dict[Labels, float] = {}
+
+    def inc(self, amount: float = 1.0, **labels: str) -> None:
+        key = _labels(labels)
+        with _lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels: str) -> float:
+        return self._values.get(_labels(labels), 0.0)
+
+    def render(self) -> List[str]:
+        lines = [f'# HELP {self.name} {self.doc}', f'# TYPE {self.name} counter']
+        with _lock:
+            for key, v in sorted(self._values.items()):
+                lines.append(f'{self.name}{_fmt(key)} {v}')
+        return lines
+
+
+class Histogram:
+    def __init__(self, name: str, doc: str, buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.name, self.doc, self.buckets = name, doc, buckets
+        # labels -> (per-bucket counts, sum, count)
+        self._values: Dict[Labels, Tuple[List[int], float, int]] = {}
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = _labels(labels)
+        with _lock:
+            counts, total, n = self._values.get(key) or ([0] * len(self.buckets), 0.0, 0)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+            self._values[key] = (counts, total + value, n + 1)
+
+    def render(self) -> List[str]:
+        lines = [f'# HELP {self.name} {self.doc}', f'# TYPE {self.name} histogram']
+        with _lock:
+            for key, (counts, total, n) in sorted(self._values.items()):
+                for bound, c in zip(self.buckets, counts):
+                    lines.append(f'{self.name}_bucket{_fmt(key, (("le", repr(bound)),))} {c}')
+                lines.append(f'{self.name}_bucket{_fmt(key, (("le", "+Inf"),))} {n}')
+                lines.append(f'{self.name}_sum{_fmt(key)} {total}')
+                lines.append(f'{self.name}_count{_fmt(key)} {n}')
+        return lines
+
+
+class Gauge:
+    """Gauge whose samples are collected from callbacks at scrape time."""
+
+    def __init__(self, name: str, doc: str):
+        self.name, self.doc = name, doc
+        self._callbacks: Dict[Labels, Callable[[], float]] = {}
+
+    def register(self, fn: Callable[[], float], **labels: str) -> None:
+        with _lock:
+            self._callbacks[_labels(labels)] = fn
+
+    def render(self) -> List[str]:
+        lines = [f'# HELP {self.name} {self.doc}', f'# TYPE {self.name} gauge']
+        with _lock:
+            callbacks = sorted(self._callbacks.items())
+        for key, fn in callbacks:
+            try:
+                lines.append(f'{self.name}{_fmt(key)} {float(fn())}')
+            except Exception:
+                continue
+        return lines
+
+
+REQUEST_LATENCY = Histogram('invoy_request_duration_seconds', 'HTTP request latency by route.')
+STAGE_LATENCY = Histogram('invoy_stage_duration_seconds', 'Latency of pipeline stages (calendar fetch, parse, render, pdf, stt, claude, resend).')
+STAGE_ERRORS = Counter('invoy_stage_errors_total', 'Pipeline stages that raised.')
+CACHE_REQUESTS = Counter('invoy_cache_requests_total', 'Cache lookups by cache and result (hit/miss).')
+EXECUTOR_QUEUE = Gauge('invoy_executor_queue_depth', 'Tasks waiting for a worker, by executor.')
+EXECUTOR_BUSY = Gauge('invoy_executor_busy_workers', 'Workers currently running a task, by executor.')
+ALLOCATIONS = Counter('invoy_allocations_total', 'Freeform allocations by path (local, claude, heuristic).')
+STT_AUDIO_SECONDS = Counter('invoy_stt_audio_seconds_total', 'Seconds of uploaded audio (total) and of audio passed to Vosk after VAD (decoded).')
+CLAUDE_TOKENS = Counter('invoy_claude_tokens_total', 'Claude tokens by call (allocate, email) and kind (input/output).')
+
+REGISTRY = [REQUEST_LATENCY, STAGE_LATENCY, STAGE_ERRORS, CACHE_REQUESTS, ALLOCATIONS, STT_AUDIO_SECONDS, CLAUDE_TOKENS, EXECUTOR_QUEUE, EXECUTOR_BUSY]
+
+
+@contextmanager
+def timed(stage: str) -> Iterator[None]:
+    """Record the wall time of a pipeline stage into STAGE_LATENCY."""
+    start = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        STAGE_ERRORS.inc(stage=stage)
+        raise
+    finally:
+        STAGE_LATENCY.observe(time.perf_counter() - start, stage=stage)
+
+
+def cache_result(cache: str, hit: bool) -> None:
+    CACHE_REQUESTS.inc(cache=cache, result='hit' if hit else 'miss')
+
+
+def render() -> str:
+    lines: List[str] = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,110 @@
+import logging
+import os
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Dict, List
+
+from .artifacts import store
+from .metrics import cache_result, timed
+
+logger = logging.getLogger(__name__)
+
+# Rendered PDFs kept in memory, evicted least-recently-used beyond this many bytes
+PDF_CACHE_MAX_BYTES = int(os.getenv('PDF_CACHE_MAX_BYTES', str(64 * 1024 * 1024)))
+
+
+class PdfCache:
+    """Size-bounded LRU of rendered PDFs keyed by invoice id.
+
+    Invoice ids are unique per finalize and their HTML is never rewritten, so
+    entries never go stale; they only need evicting for memory.
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self._items: 'OrderedDict[str, bytes]' = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+        # One render per id at a time; concurrent requests wait for it. [lock, holders + waiters]
+        self._inflight: Dict[str, List] = {}
+
+    def get(self, key: str) -> bytes | None:
+        with self._lock:
+            data = self._items.get(key)
+            if data is not None:
+                self._items.move_to_end(key)
+            return data
+
+    def put(self, key: str, data: bytes) -> None:
+        # Skip entries that would take over most of the cache
+        if len(data) > self.max_bytes // 4:
+            return
+        with self._lock:
+            old = self._items.pop(key, None)
+            if old is not None:
+                self._size -= len(old)
+            self._items[key] = data
+            self._size += len(data)
+            while self._size > self.max_bytes:
+                _, evicted = self._items.popitem(last=False)
+                self._size -= len(evicted)
+
+    @contextmanager
+    def rendering(self, key: str):
+        """Hold the render lock for `key`.
+
+        The lock stays registered until its last waiter is done; dropping it while others
+        still wait would let a later caller take a fresh lock and render the same PDF again.
+        """
+        with self._lock:
+            entry = self._inflight.setdefault(key, [threading.Lock(), 0])
+            entry[1] += 1
+        try:
+            with entry[0]:
+                yield
+        finally:
+            with self._lock:
+                entry[1] -= 1
+                if not entry[1]:
+                    self._inflight.pop(key, None)
+
+
+cache = PdfCache(PDF_CACHE_MAX_BYTES)
+
+
+def render_pdf(html: str) -> bytes:
+    """Render invoice HTML to PDF bytes in memory."""
+    from weasyprint import HTML
+    from .assets import BASE_URL, asset_url_fetcher
+    # /static/logo.png and ../assets/logo.png both resolve to assets/ via the fetcher
+    with timed("pdf"):
+        return HTML(string=html, base_url=BASE_URL, url_fetcher=asset_url_fetcher).write_pdf()
+
+
+def get_invoice_pdf(invoice_id: str) -> bytes | None:
+    """PDF for an invoice, rendered on first request and then served from memory.
+
+    Returns None when the invoice does not exist. PDFs written to disk by older
+    versions are served as-is.
+    """
+    data = cache.get(invoice_id)
+    if data is not None:
+        cache_result('pdf', True)
+        return data
+    with cache.rendering(invoice_id):
+        data = cache.get(invoice_id)
+        if data is not None:
+            cache_result('pdf', True)
+            return data
+        cache_result('pdf', False)
+        on_disk = store.find(invoice_id, 'pdf')
+        if on_disk is not None:
+            data = on_disk.read_bytes()
+        else:
+            html_path = store.find(invoice_id, 'html')
+            if html_path is None:
+                return None
+            data = render_pdf(html_path.read_text(encoding='utf-8'))
+        cache.put(invoice_id, data)
+        return data
@@ -0,0 +1,220 @@
+import asyncio
+import contextvars
+import functools
+import json
+import logging
+import os
+import random
+import secrets
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Callable, List
+
+from fastapi import Request
+from fastapi.routing import APIRoute
+
+ROOT = Path(__file__).resolve().parents[1]
+PROFILE_DIR = Path(os.getenv('PROFILE_DIR', str(ROOT / 'profiles')))
+# On-demand profiling is only honoured when a request carries this token
+ADMIN_TOKEN = os.getenv('PROFILE_ADMIN_TOKEN')
+# Fraction of all requests profiled without being asked (0 disables)
+SAMPLE_RATE = float(os.getenv('PROFILE_SAMPLE_RATE', '0') or 0)
+# Oldest profiles are deleted beyond this many
+MAX_STORED = int(os.getenv('PROFILE_MAX_STORED', '100'))
+# Without pyinstrument, sampled requests are profiled this much less often: cProfile traces
+# every call, which slows the profiled request down several times over
+CPROFILE_SAMPLE_SCALE = 0.1
+
+logger = logging.getLogger(__name__)
+
+_current: contextvars.ContextVar['ProfileSession | None'] = contextvars.ContextVar('invoy_profile', default=None)
+# Only one profiler may own the event loop thread at a time
+_loop_lock = threading.Lock()
+
+_pyinstrument = None
+
+
+def _use_pyinstrument() -> bool:
+    # Imported on the first profiled request, not with the app
+    global _pyinstrument
+    if _pyinstrument is None:
+        try:
+            import pyinstrument  # noqa: F401
+            _pyinstrument = True
+        except Exception:
+            _pyinstrument = False
+    return _pyinstrument
+
+
+class _ThreadProfiler:
+    """pyinstrument when installed, cProfile otherwise.
+
+    On the event loop pyinstrument follows the request's async context (including the child
+    task BaseHTTPMiddleware runs the endpoint in), so concurrent requests stay out of the
+    profile; 'strict' because 'enabled' still lets a sample of another task through now and
+    then around a context switch. In a worker thread it takes the whole thread, which only runs this request.
+    cProfile has no notion of context and records everything on the calling thread.
+    """
+
+    def __init__(self, in_loop: bool = True):
+        self._pyinstrument = _use_pyinstrument()
+        if self._pyinstrument:
+            from pyinstrument import Profiler
+            # The worker thread inherits the loop profiler's context, where a second
+            # context-tracking profiler isn't allowed
+            self._p = Profiler(interval=0.001, async_mode='strict' if in_loop else 'disabled')
+        else:
+            import cProfile
+            self._p = cProfile.Profile()
+
+    def start(self):
+        self._p.start() if self._pyinstrument else self._p.enable()
+
+    def stop(self):
+        if self._pyinstrument:
+            self._p.stop()
+            return self._p.last_session
+        self._p.disable()
+        return self._p
+
+
+class ProfileSession:
+    def __init__(self, request: Request, reason: str):
+        self.id = time.strftime('%Y%m%dT%H%M%S') + '-' + uuid.uuid4().hex[:8]
+        self.label = f'{request.method} {request.url.path}'
+        self.reason = reason
+        self._results: List = []
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def profile(self, in_loop: bool = True):
+        p = _ThreadProfiler(in_loop)
+        p.start()
+        try:
+            yield
+        finally:
+            result = p.stop()
+            with self._lock:
+                self._results.append(result)
+
+    def meta(self) -> dict:
+        if _use_pyinstrument():
+            return {'id': self.id, 'request': self.label, 'reason': self.reason,
+                    'profiler': 'pyinstrument', 'scope': 'request'}
+        # Deterministic tracing of the whole loop thread: other requests served meanwhile show up too
+        return {'id': self.id, 'request': self.label, 'reason': self.reason,
+                'profiler': 'cProfile', 'scope': 'event loop thread'}
+
+    def save(self) -> Path | None:
+        if not self._results:
+            return None
+        PROFILE_DIR.mkdir(parents=True, exist_ok=True)
+        (PROFILE_DIR / f'{self.id}.meta.json').write_text(json.dumps(self.meta()))
+        if _use_pyinstrument():
+            from pyinstrument.session import Session
+            from pyinstrument.renderers import HTMLRenderer, SpeedscopeRenderer
+            session = functools.reduce(Session.combine, self._results)
+            (PROFILE_DIR / f'{self.id}.speedscope.json').write_text(SpeedscopeRenderer().render(session))
+            out = PROFILE_DIR / f'{self.id}.html'
+            out.write_text(HTMLRenderer().render(session))
+        else:
+            import pstats
+            stats = pstats.Stats(self._results[0])
+            for extra in self._results[1:]:
+                stats.add(extra)
+            out = PROFILE_DIR / f'{self.id}.prof'
+            stats.dump_stats(str(out))
+        _prune()
+        logger.info("saved profile id=%s request=%r reason=%s", self.id, self.label, self.reason)
+        return out
+
+
+def _prune():
+    files = sorted(PROFILE_DIR.glob('*'), key=lambda p: p.stat().st_mtime)
+    ids = list(dict.fromkeys(f.name.split('.')[0] for f in files))
+    for stale in ids[:max(0, len(ids) - MAX_STORED)]:
+        for f in PROFILE_DIR.glob(f'{stale}.*'):
+            f.unlink(missing_ok=True)
+
+
+def is_admin(request: Request) -> bool:
+    token = request.headers.get('x-admin-token') or ''
+    return bool(ADMIN_TOKEN) and secrets.compare_digest(token, ADMIN_TOKEN)
+
+
+def _wants_profile(request: Request) -> str | None:
+    if request.url.path.startswith(('/profiles', '/metrics')):
+        return None
+    asked = request.headers.get('x-profile') == '1' or request.query_params.get('profile') == '1'
+    if asked and is_admin(request):
+        return 'requested'
+    if SAMPLE_RATE and random.random() < SAMPLE_RATE * (1 if _use_pyinstrument() else CPROFILE_SAMPLE_SCALE):
+        return 'sampled'
+    return None
+
+
+async def profile_requests(request: Request, call_next):
+    """HTTP middleware: profile this request when asked (admin token) or sampled."""
+    reason = _wants_profile(request)
+    if not reason or not _loop_lock.acquire(blocking=False):
+        return await call_next(request)
+    session = ProfileSession(request, reason)
+    token = _current.set(session)
+    try:
+        with session.profile():
+            response = await call_next(request)
+    finally:
+        _current.reset(token)
+        _loop_lock.release()
+    try:
+        await asyncio.to_thread(session.save)
+        response.headers['X-Profile-Id'] = session.id
+    except Exception:
+        logger.exception("saving profile failed id=%s", session.id)
+    return response
+
+
+def _profile_in_thread(fn: Callable) -> Callable:
+    # Sync endpoints run on the thread pool, out of reach of the loop-thread profiler;
+    # anyio copies contextvars into the worker so the active session is visible here.
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        session = _current.get()
+        if session is None:
+            return fn(*args, **kwargs)
+        with session.profile(in_loop=False):
+            return fn(*args, **kwargs)
+    return wrapper
+
+
+class ProfilingRoute(APIRoute):
+    """Route class that lets the profiler follow sync endpoints into the thread pool."""
+
+    def __init__(self, path: str, endpoint: Callable, **kwargs):
+        if not asyncio.iscoroutinefunction(endpoint):
+            endpoint = _profile_in_thread(endpoint)
+        super().__init__(path, endpoint, **kwargs)
+
+
+PROFILE_FORMATS = {'html': '.html', 'speedscope': '.speedscope.json', 'prof': '.prof', 'meta': '.meta.json'}
+
+
+def find_profile(profile_id: str, fmt: str = 'html') -> Path | None:
+    if not profile_id.replace('-', '').isalnum() or fmt not in PROFILE_FORMATS:
+        return None
+    # cProfile fallback only produces .prof (and .meta.json)
+    for suffix in (PROFILE_FORMATS[fmt], '.prof'):
+        path = PROFILE_DIR / f'{profile_id}{suffix}'
+        if path.exists():
+            return path
+    return None
+
+
+def list_profiles() -> List[str]:
+    if not PROFILE_DIR.exists():
+        return []
+    files = sorted(PROFILE_DIR.glob('*'), key=lambda p: p.stat().st_mtime, reverse=True)
+    return list(dict.fromkeys(f.name.split('.')[0] for f in files))
@@ -0,0 +1,125 @@
+import math
+import os
+import re
+from dataclasses import dataclass
+from typing import Callable, List, Tuple
+
+# Freeform text sent to Claude for allocation; longer input is condensed down to this
+ALLOCATE_INPUT_TOKENS = int(os.getenv('ALLOCATE_INPUT_TOKENS', '1500'))
+# Upper bound for the allocation reply, however many line items are expected
+ALLOCATE_MAX_OUTPUT_TOKENS = int(os.getenv('ALLOCATE_MAX_OUTPUT_TOKENS', '4096'))
+# Lower bound for the allocation reply: the fixed max_tokens used before budgeting
+ALLOCATE_MIN_OUTPUT_TOKENS = 1024
+
+# Lines longer than this (run-on /stt transcripts, pasted paragraphs) are split into sentences
+_LONG_LINE = 200
+_SENTENCE_RE = re.compile(r'(?<=[.!?])\s+')
+_PIECE_RE = re.compile(r'\w+|[^\w\s]')
+# Subjects are separated by lines, semicolons, commas and sentence ends ("20h: API, docs. Review")
+_SUBJECT_SPLIT_RE = re.compile(r'[\n;,]|(?<=[.!?])(?<!\d\.)\s+')  # not after "1." bullets
+_BULLET_RE = re.compile(r'^\s*(?:[-•*]|\d+[.)])\s+')
+_HOURS_RE = re.compile(r'(\d+(?:\.\d+)?)\s*(?:h|hrs|hours)\b', re.I)
+# What's left of "Total: 20 hours" or "Worked 20h this month" once the hours are gone
+_FILLER_RE = re.compile(r'\b(?:total|overall|billable|billed|worked|spent|hours?|hrs?|for|on|in|this|month|week)\b', re.I)
+
+
+def estimate_tokens(text: str) -> int:
+    """Local token estimate: ~4 characters per word piece, one per punctuation mark.
+
+    Within ~15% of Claude's tokenizer on English notes and transcripts, erring high,
+    which is all budgeting needs. The real counts come back in the response usage.
+    """
+    return sum(math.ceil(len(p) / 4) for p in _PIECE_RE.findall(text))
+
+
+def split_units(text: str) -> List[str]:
+    """Non-empty lines, with overlong lines split into sentences."""
+    units = []
+    for line in text.splitlines():
+        line = line.strip()
+        if not line:
+            continue
+        if len(line) > _LONG_LINE:
+            units.extend(s.strip() for s in _SENTENCE_RE.split(line) if s.strip())
+        else:
+            units.append(line)
+    return units
+
+
+def split_subjects(text: str) -> List[str]:
+    """Work subjects in freeform text, in order and without repeats.
+
+    Pieces between lines, semicolons, commas and sentence ends, with bullets and hour
+    mentions stripped ("20h: API, docs" -> ["API", "docs"]); pieces that were only an
+    hours total ("Total: 20 hours") are dropped.
+    """
+    subjects, seen = [], set()
+    for piece in _SUBJECT_SPLIT_RE.split(text):
+        piece = _BULLET_RE.sub('', piece)
+        subject = _HOURS_RE.sub(' ', piece).strip(' \t:-–—()[].!?')
+        subject = re.sub(r'\s+', ' ', subject)
+        if not re.search(r'\w', _FILLER_RE.sub(' ', subject)):
+            continue
+        key = subject.lower()
+        if key not in seen:
+            seen.add(key)
+            subjects.append(subject)
+    return subjects
+
+
+def dedup(units: List[str]) -> Tuple[List[str], int]:
+    """Drop repeated lines (ignoring case, bullets and punctuation); returns (kept, removed)."""
+    seen, kept = set(), []
+    for u in units:
+        key = ' '.join(re.findall(r'\w+', u.lower()))
+        if key in seen:
+            continue
+        seen.add(key)
+        kept.append(u)
+    return kept, len(units) - len(kept)
+
+
+def fit(units: List[str], budget: int, priority: Callable[[str], int]) -> Tuple[List[str], int]:
+    """Units that fit in `budget` tokens, most important first (lowest priority value), kept in
+    their original order; returns (kept, dropped)."""
+    costs = [estimate_tokens(u) + 1 for u in units]
+    if sum(costs) <= budget:
+        return units, 0
+    chosen, used = set(), 0
+    for i in sorted(range(len(units)), key=lambda i: (priority(units[i]), i)):
+        if used + costs[i] <= budget:
+            chosen.add(i)
+            used += costs[i]
+    return [u for i, u in enumerate(units) if i in chosen], len(units) - len(chosen)
+
+
+def output_budget(n_items: int) -> int:
+    """max_tokens for an allocation reply with about `n_items` line items.
+
+    Each item (subject, hours, one-sentence justification) is ~50 tokens of JSON and the
+    envelope ~100; the margin keeps a long subject from truncating the JSON. Never below
+    ALLOCATE_MIN_OUTPUT_TOKENS, so only inputs with many subjects get more room than before.
+    """
+    return max(ALLOCATE_MIN_OUTPUT_TOKENS, min(ALLOCATE_MAX_OUTPUT_TOKENS, 150 + 70 * max(1, n_items)))
+
+
+@dataclass
+class PreparedInput:
+    text: str
+    input_lines: int
+    duplicate_lines: int
+    dropped_lines: int
+    estimated_tokens: int
+
+    def stats(self) -> dict:
+        return {'input_lines': self.input_lines, 'duplicate_lines': self.duplicate_lines,
+                'dropped_lines': self.dropped_lines, 'estimated_input_tokens': self.estimated_tokens}
+
+
+def prepare(text: str, priority: Callable[[str], int], budget: int = ALLOCATE_INPUT_TOKENS) -> PreparedInput:
+    """Deduplicated `text`, condensed to `budget` tokens when it's longer."""
+    units = split_units(text)
+    kept, duplicates = dedup(units)
+    kept, dropped = fit(kept, budget, priority)
+    out = '\n'.join(kept)
+    return PreparedInput(out, len(units), duplicates, dropped, estimate_tokens(out))
@@ -0,0 +1,83 @@
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional, Tuple
+
+from .metrics import cache_result
+
+logger = logging.getLogger(__name__)
+
+
+class _Entry:
+    __slots__ = ('value', 'version', 'created', 'fresh_until')
+
+    def __init__(self, value, version, ttl: float):
+        now = time.monotonic()
+        self.value, self.version, self.created, self.fresh_until = value, version, now, now + ttl
+
+
+class SingleFlightCache:
+    """Coalesces concurrent calls for the same key and caches the result briefly.
+
+    Only one computation per key runs at a time; callers arriving meanwhile await
+    its result. A result is served as-is for `ttl` seconds. After that, until
+    `max_age`, the cheap `revalidate()` is called first. If it returns the version
+    the result was computed at, the cached value is reused and stays fresh for
+    another `ttl`. Event-loop local, so no locking; each worker process has its own.
+    """
+
+    def __init__(self, name: str, ttl: float, max_age: float, max_entries: int = 256):
+        self.name, self.ttl, self.max_age, self.max_entries = name, ttl, max_age, max_entries
+        self._entries: 'OrderedDict[Hashable, _Entry]' = OrderedDict()
+        self._inflight: Dict[Hashable, asyncio.Future] = {}
+
+    def _get(self, key) -> Optional[_Entry]:
+        entry = self._entries.get(key)
+        if entry is not None and time.monotonic() - entry.created > self.max_age:
+            del self._entries[key]
+            return None
+        if entry is not None:
+            self._entries.move_to_end(key)
+        return entry
+
+    def _put(self, key, entry: _Entry) -> None:
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    async def run(self, key: Hashable,
+                  compute: Callable[[], Awaitable[Tuple[Any, Optional[str]]]],
+                  revalidate: Optional[Callable[[], Awaitable[Optional[str]]]] = None) -> Any:
+        """Result for `key`. `compute()` returns (value, version); a None version isn't cached."""
+        entry = self._get(key)
+        if entry is not None and time.monotonic() < entry.fresh_until:
+            cache_result(self.name, True)
+            return entry.value
+        task = self._inflight.get(key)
+        if task is not None:
+            cache_result(self.name, True)
+        else:
+            # Its own task, so the first caller going away doesn't cancel it for the others
+            task = asyncio.ensure_future(self._fill(key, entry, compute, revalidate))
+            self._inflight[key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        return await asyncio.shield(task)
+
+    async def _fill(self, key, entry: Optional[_Entry], compute, revalidate):
+        if entry is not None and revalidate is not None:
+            try:
+                version = await revalidate()
+            except Exception as e:
+                logger.warning("%s revalidation failed, recomputing: %s", self.name, e)
+                version = None
+            if version is not None and version == entry.version:
+                cache_result(self.name, True)
+                entry.fresh_until = time.monotonic() + self.ttl
+                return entry.value
+        cache_result(self.name, False)
+        value, version = await compute()
+        if version is not None:
+            self._put(key, _Entry(value, version, self.ttl))
+        return value
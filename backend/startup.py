@@ -0,0 +1,88 @@
+import asyncio
+import logging
+import os
+import time
+from contextlib import asynccontextmanager
+from typing import Callable, Dict
+
+logger = logging.getLogger(__name__)
+
+# Subsystems warmed before the app reports ready; everything else loads on first use.
+# The Vosk model is large, so STT is opt-in: INVOY_WARMUP=db,templates,pdf,claude,allocator,stt
+DEFAULT_WARMUP = 'db,templates,pdf,claude,allocator'
+
+
+def _warm_db():
+    from .db import init_db
+    init_db()
+
+
+def _warm_templates():
+    from .utils import get_template
+    get_template('invoice_ai.html.j2')
+
+
+def _warm_pdf():
+    import weasyprint  # noqa: F401
+
+
+def _warm_claude():
+    from .ai import _claude
+    _claude()
+
+
+def _warm_google():
+    import google_auth_oauthlib.flow  # noqa: F401
+    import google.oauth2.credentials  # noqa: F401
+
+
+def _warm_allocator():
+    from .allocator import memory
+    memory.load()
+
+
+def _warm_stt():
+    # Requests are decoded on the worker pool, so that's where the models need loading
+    from .stt import warm_pool
+    warm_pool()
+
+
+WARMERS: Dict[str, Callable[[], None]] = {
+    'db': _warm_db,
+    'templates': _warm_templates,
+    'pdf': _warm_pdf,
+    'claude': _warm_claude,
+    'google': _warm_google,
+    'allocator': _warm_allocator,
+    'stt': _warm_stt,
+}
+
+
+def _timed_warm(name: str) -> None:
+    start = time.perf_counter()
+    try:
+        WARMERS[name]()
+        logger.info("warmed %s in %.0f ms", name, (time.perf_counter() - start) * 1000)
+    except Exception as e:
+        # A missing optional dependency must not keep the API from starting
+        logger.warning("warming %s failed: %s: %s", name, type(e).__name__, e)
+
+
+async def warm_up(names) -> None:
+    """Warm the given subsystems concurrently on worker threads."""
+    await asyncio.gather(*(asyncio.to_thread(_timed_warm, n) for n in names))
+
+
+@asynccontextmanager
+async def lifespan(app):
+    start = time.perf_counter()
+    names = [n.strip() for n in os.getenv('INVOY_WARMUP', DEFAULT_WARMUP).split(',') if n.strip()]
+    unknown = [n for n in names if n not in WARMERS]
+    if unknown:
+        logger.warning("ignoring unknown INVOY_WARMUP entries: %s", ', '.join(unknown))
+        names = [n for n in names if n in WARMERS]
+    await warm_up(names)
+    logger.info("ready in %.0f ms (warmed: %s)", (time.perf_counter() - start) * 1000, ', '.join(names) or 'nothing')
+    yield
+    from .stt import shutdown_pool
+    shutdown_pool()
@@ -1,25 +1,158 @@
+import asyncio
 import subprocess
+import threading
+import time
 import wave
 import json
+import math
 import os
-from vosk import Model, KaldiRecognizer
+import logging
+from array import array
+from typing import AsyncIterator, Dict, List, Tuple
 
-# Load Vosk model once globally
-model = Model("/home/hamza-ubuntu/Documents/Coding/invoy/vosk-model-small-en-us-0.15")
+from .metrics import STT_AUDIO_SECONDS, timed
 
-def transcribe_audio(file_path: str) -> str:
+logger = logging.getLogger(__name__)
+
+VOSK_MODEL_PATH = os.getenv('VOSK_MODEL_PATH', "/home/hamza-ubuntu/Documents/Coding/invoy/vosk-model-small-en-us-0.15")
+# Skip silence before decoding (0 feeds the whole recording to Vosk)
+STT_VAD = os.getenv('STT_VAD', '1') != '0'
+# Decoder processes; each loads its own copy of the model (~50 MB for the small English one)
+STT_WORKERS = int(os.getenv('STT_WORKERS') or min(4, os.cpu_count() or 1))
+
+# Energy VAD settings: 30 ms frames; speech is padded so word edges and short pauses survive
+VAD_FRAME_MS = 30
+VAD_PAD_MS = 300
+VAD_MIN_SPEECH_FRAMES = 3
+# Speech is anything this far above the noise floor (the 10th percentile frame level),
+# and never below VAD_MIN_DBFS, so near-digital silence doesn't count as speech
+VAD_MARGIN_DB = 6.0
+VAD_MIN_DBFS = -60.0
+# Keeping less than this share of the audio more likely means quiet speech was taken for
+# silence than a near-silent recording; the whole file is decoded instead
+VAD_MIN_VOICED_RATIO = 0.1
+# Frames read from the WAV at a time, for the VAD pass and for decoding
+READ_FRAMES = 4000
+
+# Vosk model is loaded once, on first use (or at startup when warmed)
+_model = None
+_model_lock = threading.Lock()
+
+def get_model():
+    global _model
+    if _model is None:
+        with _model_lock:
+            if _model is None:
+                from vosk import Model
+                _model = Model(VOSK_MODEL_PATH)
+    return _model
+
+def _frame_dbfs(pcm: bytes, frame_len: int) -> List[float]:
+    """RMS level of each frame of 16-bit mono PCM, in dBFS (-100 for digital silence)."""
+    try:
+        import numpy as np
+    except ImportError:  # pure Python fallback, fine for voice-note lengths
+        np = None
+    if np is not None:
+        samples = np.frombuffer(pcm, dtype='<i2').astype(np.float32)
+        n = len(samples) // frame_len
+        if not n:
+            return []
+        rms = np.sqrt(np.mean(np.square(samples[:n * frame_len].reshape(n, frame_len)), axis=1))
+        return (20 * np.log10(np.maximum(rms, 1e-5 * 32768) / 32768)).tolist()
+    samples = array('h', pcm[:len(pcm) - len(pcm) % 2])
+    out = []
+    for i in range(0, len(samples) - frame_len + 1, frame_len):
+        ms = sum(x * x for x in samples[i:i + frame_len]) / frame_len
+        out.append(20 * math.log10(max(math.sqrt(ms), 1e-5 * 32768) / 32768))
+    return out
+
+
+def frame_levels(wf, frame_len: int) -> List[float]:
+    """_frame_dbfs over a 16-bit mono wave.Wave_read, read in blocks instead of all at once."""
+    wf.rewind()
+    block = frame_len * max(1, READ_FRAMES // frame_len)
+    levels: List[float] = []
+    while pcm := wf.readframes(block):
+        levels.extend(_frame_dbfs(pcm, frame_len))
+    return levels
+
+
+def speech_frames(levels: List[float]) -> List[Tuple[int, int]]:
+    """Frame ranges that contain speech, given each frame's level.
+
+    Frames VAD_MARGIN_DB above the noise floor are speech; each run is padded by
+    VAD_PAD_MS on both sides and overlapping runs are merged, so pauses shorter than
+    twice the padding stay inside one segment. When that keeps under VAD_MIN_VOICED_RATIO
+    of audio that isn't all near-silence, the whole range is returned.
+    """
+    if not levels:
+        return []
+    floor = sorted(levels)[len(levels) // 10]
+    threshold = max(floor + VAD_MARGIN_DB, VAD_MIN_DBFS)
+    pad = VAD_PAD_MS // VAD_FRAME_MS
+    segments: List[List[int]] = []
+    run_start = None
+    for i, level in enumerate(levels + [-1000.0]):  # sentinel closes a trailing run
+        if level >= threshold:
+            if run_start is None:
+                run_start = i
+            continue
+        if run_start is not None:
+            if i - run_start >= VAD_MIN_SPEECH_FRAMES:
+                start, end = max(0, run_start - pad), min(len(levels), i + pad)
+                if segments and start <= segments[-1][1]:
+                    segments[-1][1] = end
+                else:
+                    segments.append([start, end])
+            run_start = None
+    voiced = sum(b - a for a, b in segments)
+    if voiced < VAD_MIN_VOICED_RATIO * len(levels) and max(levels) >= VAD_MIN_DBFS:
+        logger.debug("vad kept %d/%d frames, decoding everything", voiced, len(levels))
+        return [(0, len(levels))]
+    return [(a, b) for a, b in segments]
+
+
+def speech_segments(pcm: bytes, rate: int) -> List[Tuple[int, int]]:
+    """Byte ranges of 16-bit mono PCM that contain speech (see speech_frames)."""
+    frame_len = max(1, rate * VAD_FRAME_MS // 1000)
+    levels = _frame_dbfs(pcm, frame_len)
+    if not levels:
+        return [(0, len(pcm))] if pcm else []
+    step = frame_len * 2
+    # A segment reaching the last frame keeps the partial frame after it too
+    return [(a * step, len(pcm) if b == len(levels) else b * step) for a, b in speech_frames(levels)]
+
+
+def _decode(rec, wf, start: int, end: int) -> str:
+    """Feed frames [start, end) of the wave file to the recognizer, READ_FRAMES at a time."""
+    text = ""
+    wf.setpos(start)
+    pos = start
+    while pos < end and (data := wf.readframes(min(READ_FRAMES, end - pos))):
+        pos += len(data) // (wf.getsampwidth() * wf.getnchannels())
+        if rec.AcceptWaveform(data):
+            text += json.loads(rec.Result()).get("text", "") + " "
+    # Ends the utterance so the next segment starts fresh
+    text += json.loads(rec.FinalResult()).get("text", "")
+    return text.strip()
+
+
+def transcribe(file_path: str) -> Dict:
     """
     Transcribes an audio file (webm, wav, mp3, etc.) to text using Vosk.
-    Converts to 16kHz mono WAV if needed.
+    Converts to 16kHz mono WAV if needed. Silence is cut out before decoding
+    (see speech_frames), so only voiced audio reaches the recognizer. The file is
+    streamed for both passes, never held in memory whole.
 
     Args:
         file_path: path to the uploaded audio file
 
     Returns:
-        str: transcribed text
+        dict: text, duration_s, voiced_s, skipped_ratio, segments
     """
     # Ensure .wav format
-    print("Transcribing audio file:", file_path)
+    logger.debug("transcribing audio path=%s", file_path)
     wav_path = file_path
     if not file_path.endswith(".wav"):
         wav_path = file_path.rsplit(".", 1)[0] + ".wav"
@@ -28,25 +161,137 @@ def transcribe_audio(file_path: str) -> str:
             "-ar", "16000", "-ac", "1", "-f", "wav", wav_path
         ], stdout=subprocess.PIPE, stderr=subprocess.PIPE)
 
-    wf = wave.open(wav_path, "rb")
-    rec = KaldiRecognizer(model, wf.getframerate())
+    try:
+        with wave.open(wav_path, "rb") as wf:
+            rate, width, channels, nframes = wf.getframerate(), wf.getsampwidth(), wf.getnchannels(), wf.getnframes()
+            # The energy VAD only understands 16-bit mono; anything else is decoded whole
+            if STT_VAD and width == 2 and channels == 1:
+                frame_len = max(1, rate * VAD_FRAME_MS // 1000)
+                levels = frame_levels(wf, frame_len)
+                # A segment reaching the last frame keeps the partial frame after it too
+                segments = [(a * frame_len, nframes if b == len(levels) else b * frame_len)
+                            for a, b in speech_frames(levels)]
+            else:
+                segments = [(0, nframes)] if nframes else []
 
-    text = ""
-    while True:
-        data = wf.readframes(4000)
-        if len(data) == 0:
-            break
-        if rec.AcceptWaveform(data):
-            result = json.loads(rec.Result())
-            text += result.get("text", "") + " "
+            from vosk import KaldiRecognizer
+            rec = KaldiRecognizer(get_model(), rate)
+            parts = [_decode(rec, wf, a, b) for a, b in segments]
+    finally:
+        # Clean up converted wav if needed
+        if wav_path != file_path:
+            os.remove(wav_path)
+    text = " ".join(p for p in parts if p)
 
-    final = json.loads(rec.FinalResult())
-    text += final.get("text", "")
+    duration = nframes / rate if rate else 0.0
+    voiced = sum(b - a for a, b in segments) / rate if rate else 0.0
+    skipped = 1 - voiced / duration if duration else 0.0
+    logger.debug("vad segments=%d duration=%.1fs voiced=%.1fs skipped=%.0f%%", len(segments), duration, voiced, skipped * 100)
+    return {
+        "text": text,
+        "duration_s": round(duration, 2),
+        "voiced_s": round(voiced, 2),
+        "skipped_ratio": round(skipped, 3),
+        "segments": len(segments),
+    }
 
-    wf.close()
 
-    # Clean up converted wav if needed
-    if wav_path != file_path:
-        os.remove(wav_path)
+def transcribe_audio(file_path: str) -> str:
+    """Transcribed text only; see transcribe() for the VAD stats."""
+    return transcribe(file_path)["text"]
+
+
+# ---------- decoder process pool ----------
+# Vosk decoding is CPU-bound and holds the GIL for long stretches, so uploads are
+# decoded in worker processes instead of threads. Workers are spawned, not forked,
+# so they don't inherit the server's threads and locks.
+
+_pool = None
+_pool_lock = threading.Lock()
+_inflight = 0
+
+
+def _init_worker():
+    logging.basicConfig(level=os.getenv("LOG_LEVEL", "INFO").upper())
+    try:
+        get_model()
+    except Exception:
+        # Reported per file by transcribe() instead of breaking the whole pool
+        logger.exception("vosk model failed to load in worker pid=%d", os.getpid())
+
+
+def _ping() -> int:
+    return os.getpid()
+
+
+def get_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            import multiprocessing
+            from concurrent.futures import ProcessPoolExecutor
+            _pool = ProcessPoolExecutor(
+                max_workers=STT_WORKERS,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_worker,
+            )
+            logger.info("stt pool started workers=%d", STT_WORKERS)
+        return _pool
+
+
+def inflight() -> int:
+    """Files submitted to the pool and not finished yet."""
+    return _inflight
+
+
+def warm_pool() -> None:
+    """Start every worker (each loads its model) before the first upload arrives."""
+    pool = get_pool()
+    pids = {f.result() for f in [pool.submit(_ping) for _ in range(STT_WORKERS)]}
+    logger.info("stt pool warmed workers=%d", len(pids))
+
+
+def shutdown_pool() -> None:
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+            _pool = None
+
+
+async def transcribe_async(file_path: str) -> Dict:
+    """transcribe() on the decoder pool, without blocking the event loop."""
+    global _inflight
+    from concurrent.futures.process import BrokenProcessPool
+    _inflight += 1
+    try:
+        with timed("stt_decode"):
+            result = await asyncio.get_running_loop().run_in_executor(get_pool(), transcribe, file_path)
+    except BrokenProcessPool:
+        # A worker died (e.g. OOM); start a fresh pool for the next request
+        shutdown_pool()
+        raise
+    finally:
+        _inflight -= 1
+    STT_AUDIO_SECONDS.inc(result["duration_s"], kind="total")
+    STT_AUDIO_SECONDS.inc(result["voiced_s"], kind="decoded")
+    return result
+
+
+async def transcribe_many(paths: List[str]) -> AsyncIterator[Tuple[int, Dict]]:
+    """Decode files in parallel, yielding (index, result) in completion order.
+
+    A file that fails yields {"error": ...} instead of stopping the batch.
+    """
+    async def one(i, path):
+        start = time.perf_counter()
+        try:
+            result = await transcribe_async(path)
+        except Exception as e:
+            logger.warning("batch transcription failed path=%s error=%s", path, e)
+            result = {"error": f"{type(e).__name__}: {e}"}
+        result["elapsed_ms"] = round((time.perf_counter() - start) * 1000)
+        return i, result
 
-    return text.strip()
\ No newline at end of file
+    for next_done in asyncio.as_completed([one(i, p) for i, p in enumerate(paths)]):
+        yield await next_done
@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+"""Synthetic inputs for benchmarks and load tests.
+
+Calendar exports follow the data/calendar_sample.txt format so they can be fed
+straight into parse_calendar_txt / generate_my_invoice.
+"""
+import math
+import random
+import struct
+import wave
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+CONSULTANT_EMAIL = 'consultant@example.com'
+
+_TOPICS = ['Weekly Sync', 'Architecture Review', 'API Design', 'Sprint Planning', 'Retro',
+           'Data Migration', 'Security Audit', 'Onboarding', 'Roadmap', 'Incident Review']
+_VERBS = ['Reviewed', 'Implemented', 'Refactored', 'Documented', 'Tested', 'Deployed', 'Designed', 'Debugged']
+_OBJECTS = ['auth flow', 'billing service', 'API gateway', 'data pipeline', 'dashboard',
+            'CI config', 'search index', 'onboarding docs', 'payment webhooks', 'reporting jobs']
+
+
+def client_emails(n_clients: int):
+    return [f'contact{i}@client{i}.com' for i in range(n_clients)]
+
+
+def make_client_directory(n_clients: int = 5):
+    """ClientDirectory covering the client_emails() domains."""
+    from backend.clients import Client, ClientDirectory
+    return ClientDirectory(
+        Client(key=f'client{i}', name=f'Contact{i}', email=email, company=f'Client {i} Inc', domains=(email.split('@')[1],))
+        for i, email in enumerate(client_emails(n_clients))
+    )
+
+
+def make_events(n_events: int, n_clients: int = 5, seed: int = 0, month: str = '2025-09'):
+    """Google Calendar API style event resources (summary/start.dateTime/attendees[].email)."""
+    rng = random.Random(seed)
+    clients = client_emails(n_clients)
+    base = datetime.fromisoformat(f'{month}-01T08:00:00').replace(tzinfo=timezone.utc)
+    events = []
+    for i in range(n_events):
+        start = base + timedelta(days=rng.randrange(28), hours=rng.randrange(9), minutes=rng.choice([0, 15, 30, 45]))
+        end = start + timedelta(minutes=rng.choice([10, 30, 45, 60, 90, 120]))
+        topic = rng.choice(_TOPICS)
+        title = f'{topic} - internal' if rng.random() < 0.05 else topic
+        attendees = [{'displayName': 'John Consultant', 'email': CONSULTANT_EMAIL}]
+        for email in rng.sample(clients, k=min(len(clients), rng.choice([1, 1, 1, 2]))):
+            attendees.append({'displayName': email.split('@')[0].title(), 'email': email})
+        events.append({
+            'id': f'ev_{i:06d}',
+            'iCalUID': f'ev_{i:06d}@bench',
+            'summary': title,
+            'description': f'Discussed {rng.choice(_OBJECTS)}. Agenda: {topic}, next steps.',
+            'start': {'dateTime': start.isoformat()},
+            'end': {'dateTime': end.isoformat()},
+            'status': 'cancelled' if rng.random() < 0.03 else 'confirmed',
+            'attendees': attendees,
+        })
+    events.sort(key=lambda e: e['start']['dateTime'])
+    return events
+
+
+def make_calendar_txt(n_events: int, n_clients: int = 5, seed: int = 0, month: str = '2025-09') -> str:
+    """Render make_events() in the calendar_sample.txt export format."""
+    lines = [f'# Calendar export (synthetic) - Billing Period: {month}-01 to {month}-28',
+             '# Timezone: UTC', '# Source: bench_data', '']
+    for ev in make_events(n_events, n_clients, seed, month):
+        lines += ['Event:',
+                  f"  id: {ev['id']}",
+                  f"  title: {ev['summary']}",
+                  f"  description: {ev['description']}",
+                  f"  start: {ev['start']['dateTime']}",
+                  f"  end:   {ev['end']['dateTime']}",
+                  f"  status: {ev['status']}",
+                  '  attendees:']
+        for a in ev['attendees']:
+            lines += [f"    - name: {a['displayName']}", f"      email: {a['email']}"]
+        lines.append('')
+    return '\n'.join(lines) + '\n'
+
+
+def make_freeform(n_subjects: int, seed: int = 0, client: str = 'Acme Corp') -> str:
+    """Freeform allocation input like the README example."""
+    rng = random.Random(seed)
+    total = round(n_subjects * rng.uniform(1.5, 4.0), 1)
+    lines = [f'For {client}, September billing. Total {total} hours.']
+    for _ in range(n_subjects):
+        lines.append(f'- {rng.choice(_VERBS)} {rng.choice(_OBJECTS)}: {rng.choice(_TOPICS).lower()} follow-up')
+    return '\n'.join(lines)
+
+
+def make_wav(path: Path, seconds: float = 3.0, rate: int = 16000, silence_ratio: float = 0.4, seed: int = 0,
+             block_s: float = 1.0) -> Path:
+    """16 kHz mono PCM WAV alternating voiced-like tone bursts and silence, in block_s blocks."""
+    rng = random.Random(seed)
+    n = int(seconds * rate)
+    frames = bytearray()
+    block = max(1, int(rate * block_s))
+    for start in range(0, n, block):
+        voiced = rng.random() >= silence_ratio
+        f0 = rng.uniform(110, 220)
+        for i in range(start, min(n, start + block)):
+            if voiced:
+                t = i / rate
+                s = 0.4 * math.sin(2 * math.pi * f0 * t) + 0.2 * math.sin(2 * math.pi * 2.5 * f0 * t)
+                s += rng.uniform(-0.05, 0.05)
+            else:
+                s = rng.uniform(-0.002, 0.002)
+            frames += struct.pack('<h', int(max(-1.0, min(1.0, s)) * 32767))
+    path = Path(path)
+    with wave.open(str(path), 'wb') as wf:
+        wf.setnchannels(1)
+        wf.setsampwidth(2)
+        wf.setframerate(rate)
+        wf.writeframes(bytes(frames))
+    return path
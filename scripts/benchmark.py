@@ -0,0 +1,203 @@
+#!/usr/bin/env python3
+"""Reproducible benchmarks for the invoice pipeline.
+
+Times calendar parsing, billable filtering, invoice generation/finalization
+(HTML and PDF), hour allocation and transcription across input sizes, with
+Google/Anthropic/Resend replaced by local stubs. Results are written as JSON so
+runs from different commits can be compared:
+
+    python -m scripts.benchmark --out bench-main.json
+    python -m scripts.benchmark --out bench-branch.json --compare bench-main.json
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+from scripts import bench_data
+from scripts.stub_servers import start_stubs, stub_env
+
+SIZES = {
+    'calendar_events': [10, 100, 1000, 5000],
+    'line_items': [5, 50, 200],
+    'subjects': [3, 10, 50],
+    'audio_seconds': [3, 10],
+}
+QUICK_SIZES = {
+    'calendar_events': [10, 100],
+    'line_items': [5],
+    'subjects': [3],
+    'audio_seconds': [3],
+}
+
+
+def _measure(fn, repeats: int):
+    fn()  # warmup
+    samples = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    return {
+        'repeats': repeats,
+        'min': min(samples),
+        'median': statistics.median(samples),
+        'mean': statistics.fmean(samples),
+        'max': max(samples),
+    }
+
+
+def _git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=ROOT, capture_output=True, text=True, check=True).stdout.strip()
+    except Exception:
+        return None
+
+
+def run(sizes, repeats: int, workdir: Path, wav: Path | None):
+    from scripts import generate_invoices as gi
+    from backend import utils, ai
+    from backend.artifacts import store
+    from backend import clients
+
+    # Keep generated invoices out of the real output/ dir
+    store.root = workdir / 'output'
+    consultant, branding, rules = gi.load_config()
+    loop = asyncio.new_event_loop()
+    results = []
+
+    def bench(name, size, fn, n=repeats):
+        try:
+            stats = _measure(fn, n)
+        except Exception as e:
+            results.append({'name': name, 'size': size, 'skipped': f'{type(e).__name__}: {e}'})
+            print(f'  {name:<28} {size:>6}  skipped ({type(e).__name__}: {e})')
+            return
+        results.append({'name': name, 'size': size, **stats})
+        print(f"  {name:<28} {size:>6}  median {stats['median'] * 1000:9.2f} ms")
+
+    # Point the configured consultant at the synthetic one so the filter does real work
+    gi.load_config = lambda: ({**consultant, 'email': bench_data.CONSULTANT_EMAIL}, branding, rules)
+    # Synthetic clients, and no token DB lookups
+    directory = bench_data.make_client_directory()
+    gi.get_directory = clients.get_directory = lambda *a, **k: directory
+    for n in sizes['calendar_events']:
+        txt = bench_data.make_calendar_txt(n)
+        path = workdir / f'calendar_{n}.txt'
+        path.write_text(txt)
+        events = gi.parse_calendar_txt(txt)
+        bench('parse_calendar_txt', n, lambda: gi.parse_calendar_txt(txt))
+        bench('is_billable', n, lambda: [e for e in events if gi.is_billable(e, rules, bench_data.CONSULTANT_EMAIL)])
+        bench('generate_my_invoice', n, lambda: gi.generate_my_invoice(str(path)))
+
+    for n in sizes['line_items']:
+        items = [{'subject': f'Task {i}', 'hours': 1.5, 'justification': 'bench'} for i in range(n)]
+        bench('finalize_invoice_html', n, lambda: utils.finalize_invoice('Bench Client', items, '2025-09'))
+        bench('finalize_invoice_pdf', n, lambda: _finalize_pdf(utils, items), n=max(1, repeats // 2))
+
+    for n in sizes['subjects']:
+        subjects = [f'Subject number {i} with some words' for i in range(n)]
+        freeform = bench_data.make_freeform(n)
+        bench('allocate_hours', n, lambda: loop.run_until_complete(ai.allocate_hours('Bench', 40.0, subjects, None)))
+        bench('parse_freeform_with_claude', n, lambda: loop.run_until_complete(ai.parse_freeform_with_claude(freeform, None, None)))
+
+    for seconds in sizes['audio_seconds']:
+        path = wav or bench_data.make_wav(workdir / f'note_{seconds}s.wav', seconds=seconds)
+        bench('vad_segments', seconds, lambda: _vad(path))
+        bench('transcribe_audio', seconds, lambda: _transcribe(path), n=max(1, repeats // 2))
+        if wav:
+            break
+
+    loop.close()
+    return results
+
+
+def _finalize_pdf(utils, items):
+    # Finalize plus the first (uncached) PDF render, as on the first download
+    import weasyprint  # noqa: F401  fail fast (skip) when WeasyPrint's native libs are missing
+    from backend.pdf import get_invoice_pdf
+    get_invoice_pdf(utils.finalize_invoice('Bench Client', items, '2025-09')['invoice_id'])
+
+
+def _vad(path):
+    # The streamed pass transcribe() runs before decoding
+    import wave
+    from backend.stt import VAD_FRAME_MS, frame_levels, speech_frames
+    with wave.open(str(path), 'rb') as wf:
+        return speech_frames(frame_levels(wf, wf.getframerate() * VAD_FRAME_MS // 1000))
+
+
+def _transcribe(path):
+    from backend.stt import transcribe_audio
+    return transcribe_audio(str(path))
+
+
+def compare(current, baseline, threshold: float) -> bool:
+    """Print median ratios against a baseline run; return True if any benchmark regressed."""
+    base = {(r['name'], r['size']): r for r in baseline['results'] if 'median' in r}
+    regressed = False
+    print(f"\nvs {baseline.get('commit') or 'baseline'}:")
+    for r in current['results']:
+        b = base.get((r['name'], r['size']))
+        if not b or 'median' not in r:
+            continue
+        ratio = r['median'] / b['median'] if b['median'] else float('inf')
+        flag = ''
+        if ratio > 1 + threshold:
+            flag, regressed = '  REGRESSION', True
+        print(f"  {r['name']:<28} {r['size']:>6}  {ratio:6.2f}x{flag}")
+    return regressed
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the invoice pipeline offline.')
+    parser.add_argument('--out', default='bench_output.json', help='Where to write JSON results')
+    parser.add_argument('--repeats', type=int, default=5, help='Timed runs per benchmark (after one warmup)')
+    parser.add_argument('--quick', action='store_true', help='Small sizes only')
+    parser.add_argument('--wav', type=Path, help='Use this WAV for transcribe_audio instead of a synthetic one')
+    parser.add_argument('--latency-ms', type=float, default=0.0, help='Latency injected by the API stubs')
+    parser.add_argument('--compare', type=Path, help='Baseline JSON to compare medians against')
+    parser.add_argument('--threshold', type=float, default=0.15, help='Relative slowdown treated as a regression')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    stubs = start_stubs(latency_ms=args.latency_ms)
+    os.environ.update(stub_env(stubs))
+
+    try:
+        with tempfile.TemporaryDirectory(prefix='invoy-bench-') as tmp:
+            results = run(QUICK_SIZES if args.quick else SIZES, args.repeats, Path(tmp), args.wav)
+    finally:
+        for s in stubs.values():
+            s.stop()
+
+    report = {
+        'commit': _git_commit(),
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'stub_latency_ms': args.latency_ms,
+        'results': results,
+    }
+    Path(args.out).write_text(json.dumps(report, indent=2))
+    print(f'\nWrote {args.out}')
+
+    if args.compare:
+        if compare(report, json.loads(args.compare.read_text()), args.threshold):
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+"""Fail when importing the API gets slower or starts pulling in heavy dependencies.
+
+Runs `python -X importtime -c "import backend.app"` in a fresh interpreter a few
+times and checks:
+  * the median import time of backend.app stays within a budget relative to FastAPI's
+    own import in the same interpreter, so the check scales with the machine instead of
+    flaking on slower CI
+  * none of the lazily-loaded dependencies (Vosk, WeasyPrint, Anthropic, google-auth,
+    SQLAlchemy, Jinja, requests) are imported eagerly
+
+Also run by the test suite (tests/test_import_time.py).
+
+    python scripts/check_import_time.py --budget-ratio 1.5
+"""
+import argparse
+import os
+import re
+import statistics
+import subprocess
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+
+# Loaded on first use or by the startup warmup (backend/startup.py), never at import
+LAZY_MODULES = ['vosk', 'weasyprint', 'anthropic', 'google_auth_oauthlib', 'google.oauth2',
+                'sqlalchemy', 'jinja2', 'requests', 'pyinstrument', 'numpy', 'httpx', 'pyarrow']
+# The import backend.app can't avoid; the budget is a multiple of it (~1.1x today)
+BASELINE_MODULE = 'fastapi'
+BUDGET_RATIO = float(os.getenv('IMPORT_BUDGET_RATIO', '1.5'))
+
+_LINE = re.compile(r'^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)$')
+
+
+def measure(module: str = 'backend.app'):
+    """Return (cumulative microseconds for `module`, {imported module: cumulative us})."""
+    proc = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+                          cwd=ROOT, capture_output=True, text=True, env={**os.environ, 'PYTHONDONTWRITEBYTECODE': '1'})
+    if proc.returncode != 0:
+        raise SystemExit(f'import {module} failed:\n{proc.stderr[-2000:]}')
+    imported = {}
+    for line in proc.stderr.splitlines():
+        m = _LINE.match(line)
+        if m:
+            imported[m.group(4)] = int(m.group(2))
+    return imported.get(module, 0), imported
+
+
+def check(runs: int = 3, budget_ratio: float = BUDGET_RATIO, budget_ms: float | None = None):
+    """(median ms, ratio to the baseline import, imported modules of the last run, failures)."""
+    results = [measure() for _ in range(runs)]
+    median_ms = statistics.median(total for total, _ in results) / 1000
+    ratio = statistics.median(total / max(1, imported.get(BASELINE_MODULE, 0)) for total, imported in results)
+    imported = results[-1][1]
+
+    failures = []
+    if ratio > budget_ratio:
+        failures.append(f'import time {ratio:.2f}x {BASELINE_MODULE} exceeds budget {budget_ratio:.2f}x')
+    if budget_ms is not None and median_ms > budget_ms:
+        failures.append(f'import time {median_ms:.0f} ms exceeds budget {budget_ms:.0f} ms')
+    eager = [m for m in LAZY_MODULES if m in imported]
+    if eager:
+        failures.append('imported eagerly (should be lazy): ' + ', '.join(eager))
+    return median_ms, ratio, imported, failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Check the import-time budget of backend.app.')
+    parser.add_argument('--budget-ratio', type=float, default=BUDGET_RATIO,
+                        help=f'Maximum median import time as a multiple of {BASELINE_MODULE}\'s '
+                             '(default: $IMPORT_BUDGET_RATIO or 1.5)')
+    parser.add_argument('--budget-ms', type=float, default=None,
+                        help='Also fail past this many milliseconds (off by default; machine-dependent)')
+    parser.add_argument('--runs', type=int, default=3)
+    parser.add_argument('--top', type=int, default=10, help='Show the N slowest top-level imports')
+    args = parser.parse_args()
+
+    median_ms, ratio, imported, failures = check(args.runs, args.budget_ratio, args.budget_ms)
+    print(f'backend.app import: {median_ms:.0f} ms, {ratio:.2f}x {BASELINE_MODULE} '
+          f'(median of {args.runs}, budget {args.budget_ratio:.2f}x)')
+    for name, us in sorted(imported.items(), key=lambda kv: -kv[1])[:args.top]:
+        print(f'  {us / 1000:8.1f} ms  {name}')
+    for f in failures:
+        print('FAIL:', f)
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
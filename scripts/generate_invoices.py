@@ -1,18 +1,29 @@
 #!/usr/bin/env python3
 import argparse
 import json
+import logging
 import re
+import sys
+from contextlib import nullcontext
 from datetime import datetime, timezone
 from pathlib import Path
 
 from dateutil import parser as dtp
-from jinja2 import Environment, FileSystemLoader, select_autoescape
 import pytz
 
 ROOT = Path(__file__).resolve().parents[1]
+# Allow running as `python scripts/generate_invoices.py` as well as `-m scripts.generate_invoices`
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+from backend.metrics import timed
+from backend.artifacts import store
+from backend.clients import get_directory
+from backend.utils import get_template
+
+logger = logging.getLogger(__name__)
+
 DATA = ROOT / 'data'
-TEMPLATES = ROOT / 'templates'
-OUTPUT = ROOT / 'output'
 
 
 def load_config():
@@ -30,6 +41,17 @@ class Event:
         self.status = d.get('status', 'confirmed')
         self.attendees = d.get('attendees', [])
 
+    @classmethod
+    def from_api(cls, ev):
+        """Event from a Google Calendar API event resource."""
+        start, end = ev.get('start', {}), ev.get('end', {})
+        return cls({
+            'id': ev.get('id') or '-', 'title': ev.get('summary') or '-', 'description': ev.get('description') or '',
+            'start': start.get('dateTime') or start.get('date'), 'end': end.get('dateTime') or end.get('date'),
+            'status': ev.get('status') or 'confirmed',
+            'attendees': [{'name': a.get('displayName', ''), 'email': a.get('email', '')} for a in ev.get('attendees', [])],
+        })
+
     @property
     def duration_hours(self):
         start = dtp.parse(self.start)
@@ -75,18 +97,23 @@ def is_billable(event: Event, rules, consultant_email: str):
     return len(others) > 0
 
 
-def identify_client(event: Event, consultant_email: str):
+def identify_client(event: Event, consultant_email: str, directory=None):
+    # Known clients (data/config.json / DB) win over whoever happens to be listed first
+    if directory is not None:
+        client = directory.resolve(event.attendees, consultant_email)
+        if client is not None:
+            return client.as_invoice_client()
     others = [a for a in event.attendees if a['email'].lower() != consultant_email.lower()]
     if not others:
         return None
     a = others[0]
-    return {'name': a.get('name') or a['email'], 'email': a['email'], 'company': None}
+    return {'name': a.get('name') or a['email'], 'email': a['email'], 'company': None, 'key': a['email'].lower()}
 
 
-def render_invoice(consultant, branding, client_key, client_info, items, period_start, period_end):
-    env = Environment(loader=FileSystemLoader(str(TEMPLATES)), autoescape=select_autoescape(['html','xml']))
-    tmpl = env.get_template('invoice.html.j2')
-    rate = float(consultant['hourlyRate'])
+def render_invoice(consultant, branding, client_key, client_info, items, period_start, period_end, pdf=False, invoice_id=None):
+    # Compiled once per process, shared with the API's finalize path
+    tmpl = get_template('invoice.html.j2')
+    rate = float(client_info.get('hourlyRate') or consultant['hourlyRate'])
     for it in items:
         it['rate'] = rate
         it['amount'] = round(it['durationHours'] * rate, 2)
@@ -96,7 +123,8 @@ def render_invoice(consultant, branding, client_key, client_info, items, period_
     total_due = round(subtotal + tax_amount, 2)
 
     invoice = {
-        'invoiceId': f"INV-{client_key}-{period_start[:7].replace('-', '')}",
+        # Unique per run; re-generating a period no longer overwrites the previous file
+        'invoiceId': invoice_id or store.new_invoice_id('INV', client_key),
         'issueDate': datetime.now(timezone.utc).date().isoformat(),
         'billingPeriodStart': period_start,
         'billingPeriodEnd': period_end
@@ -112,67 +140,101 @@ def render_invoice(consultant, branding, client_key, client_info, items, period_
         totals={'subtotal': subtotal, 'taxAmount': tax_amount, 'totalDue': total_due},
         currencySymbol=currency_symbol
     )
-    OUTPUT.mkdir(parents=True, exist_ok=True)
-    out = OUTPUT / f"{invoice['invoiceId']}.html"
-    out.write_text(html, encoding='utf-8')
+    out = store.write_text(invoice['invoiceId'], 'html', html)
+    if pdf:
+        from weasyprint import HTML
+        from backend.assets import BASE_URL, asset_url_fetcher
+        # Relative asset links (../assets/logo.png) resolve into assets/, not the output dir
+        with store.atomic_path(invoice['invoiceId'], 'pdf') as tmp:
+            HTML(string=html, base_url=BASE_URL, url_fetcher=asset_url_fetcher).write_pdf(str(tmp))
     return out
 
-def generate_my_invoice(filename):
-    consultant, branding, rules = load_config()
-    txt = Path(filename).read_text()
-    events = parse_calendar_txt(txt)
-    billable = [e for e in events if is_billable(e, rules, consultant['email'])]
-
-    m = re.search(r"Billing Period:\s*(\d{4}-\d{2}-\d{2})\s*to\s*(\d{4}-\d{2}-\d{2})", txt)
-    print("m", m)
-    if m:
-        period_start, period_end = m.group(1), m.group(2)
-    else:
-        period_start = events[0].start[:10]
-        period_end = events[-1].end[:10]
-    print("period_start", period_start)
-    print("period_end", period_end)
+def invoice_events(billable, consultant, branding, period_start, period_end, directory, export=None, pdf=False):
+    """Render one invoice per client for the billable events.
 
+    Returns (invoice paths, hours of the last billed event, its rate). With `export`
+    (backend.exports.EventExport) every billed event is written out as soon as it is
+    assigned to a client.
+    """
+    tz = pytz.timezone(consultant['timezone'])
+    exported_at = datetime.now(timezone.utc).isoformat()
     by_client = {}
-    duration_hours = 0.0
+    duration_hours, rate = 0.0, float(consultant['hourlyRate'])
     for e in billable:
-        print("e", e)
-        client = identify_client(e, consultant['email'])
+        client = identify_client(e, consultant['email'], directory)
         if not client:
             continue
-        key = client['email'].lower()
-        by_client.setdefault(key, {'info': client, 'items': []})
-        print("key", key)
-        start = dtp.parse(e.start)
-        end = dtp.parse(e.end)
-        print("1", key)
-        tz = pytz.timezone(consultant['timezone'])
-        start_local = start.astimezone(tz)
-        print("2", key)
-        end_local = end.astimezone(tz)
-
-        print("3", key)
+        key = client['key']
+        slug = key.replace('@', '_').replace('.', '-')
+        if key not in by_client:
+            # Known up front so exported rows can point at the invoice they end up on
+            by_client[key] = {'info': client, 'items': [], 'slug': slug, 'invoice_id': store.new_invoice_id('INV', slug)}
+        start_local = dtp.parse(e.start).astimezone(tz)
+        end_local = dtp.parse(e.end).astimezone(tz)
+        duration_hours = e.duration_hours
+        rate = float(client.get('hourlyRate') or consultant['hourlyRate'])
         by_client[key]['items'].append({
             'date': start_local.strftime('%Y-%m-%d'),
             'timeRange': f"{start_local.strftime('%H:%M')}–{end_local.strftime('%H:%M')}",
             'subject': e.title,
             'agenda': (e.description or '').split('Agenda:')[-1].strip() if 'Agenda:' in (e.description or '') else '',
-            'durationHours': e.duration_hours
+            'durationHours': duration_hours
         })
-        duration_hours = e.duration_hours
-        rate = float(consultant['hourlyRate'])
-    print("by_client", by_client)
+        if export is not None:
+            export.write({
+                'event_id': e.id, 'start': e.start, 'end': e.end, 'date': start_local.strftime('%Y-%m-%d'),
+                'subject': e.title, 'consultant_email': consultant['email'],
+                'client_key': key, 'client_name': client.get('name') or '', 'client_email': client.get('email') or '',
+                'client_company': client.get('company') or '',
+                'hours': round(duration_hours, 4), 'rate': rate, 'amount': round(duration_hours * rate, 2),
+                'currency': consultant['currency'], 'invoice_id': by_client[key]['invoice_id'],
+                'period_start': period_start, 'period_end': period_end, 'exported_at': exported_at,
+            })
+
     generated = []
     for key, data in by_client.items():
-        out = render_invoice(consultant, branding, key.replace('@','_').replace('.', '-'), data['info'], data['items'], period_start, period_end)
-        generated.append(str(out))
+        with timed("render"):
+            out = render_invoice(consultant, branding, data['slug'], data['info'], data['items'], period_start, period_end,
+                                 pdf=pdf, invoice_id=data['invoice_id'])
+        generated.append(out)
+    return generated, duration_hours, rate
+
+
+def generate_invoice_for_events(events, period_start=None, period_end=None, export=None):
+    """Like generate_my_invoice, for already parsed events (e.g. straight from the Calendar API).
+
+    The invoice path is None when no event was billable.
+    """
+    consultant, branding, rules = load_config()
+    with timed("billable_filter"):
+        billable = [e for e in events if is_billable(e, rules, consultant['email'])]
+    if not (period_start and period_end) and events:
+        period_start = events[0].start[:10]
+        period_end = events[-1].end[:10]
+    logger.debug("billing period %s to %s events=%d billable=%d", period_start, period_end, len(events), len(billable))
+
+    generated, duration_hours, rate = invoice_events(billable, consultant, branding, period_start, period_end,
+                                                     get_directory(), export=export)
+    if not generated:
+        logger.info("no billable events, no invoice generated")
+        return None, 0.0, rate
+    logger.info("generated invoices: %s", ', '.join(map(str, generated)))
+    return generated[-1], duration_hours, rate
+
+
+def generate_my_invoice(filename):
+    txt = Path(filename).read_text()
+    with timed("parse"):
+        events = parse_calendar_txt(txt)
+    m = re.search(r"Billing Period:\s*(\d{4}-\d{2}-\d{2})\s*to\s*(\d{4}-\d{2}-\d{2})", txt)
+    return generate_invoice_for_events(events, *(m.groups() if m else ()))
 
-    print('Generated invoices:', *generated, sep='\n - ')
 
-    return out, duration_hours, rate
 def main():
     parser = argparse.ArgumentParser(description='Generate invoice HTML from calendar txt sample.')
     parser.add_argument('--input', default=str(DATA / 'calendar_sample.txt'), help='Path to calendar txt')
+    parser.add_argument('--pdf', action='store_true', help='Also write a PDF next to each HTML invoice (run as `python -m scripts.generate_invoices`)')
+    parser.add_argument('--export', choices=['ndjson', 'parquet'], help='Also export the billed events (see backend/exports.py)')
     args = parser.parse_args()
 
     consultant, branding, rules = load_config()
@@ -187,32 +249,16 @@ def main():
         period_start = events[0].start[:10]
         period_end = events[-1].end[:10]
 
-    by_client = {}
-    for e in billable:
-        client = identify_client(e, consultant['email'])
-        if not client:
-            continue
-        key = client['email'].lower()
-        by_client.setdefault(key, {'info': client, 'items': []})
-        start = dtp.parse(e.start)
-        end = dtp.parse(e.end)
-        tz = pytz.timezone(consultant['timezone'])
-        start_local = start.astimezone(tz)
-        end_local = end.astimezone(tz)
-        by_client[key]['items'].append({
-            'date': start_local.strftime('%Y-%m-%d'),
-            'timeRange': f"{start_local.strftime('%H:%M')}–{end_local.strftime('%H:%M')}",
-            'subject': e.title,
-            'agenda': (e.description or '').split('Agenda:')[-1].strip() if 'Agenda:' in (e.description or '') else '',
-            'durationHours': e.duration_hours
-        })
-
-    generated = []
-    for key, data in by_client.items():
-        out = render_invoice(consultant, branding, key.replace('@','_').replace('.', '-'), data['info'], data['items'], period_start, period_end)
-        generated.append(str(out))
+    # Config clients only; the CLI doesn't touch the token DB
+    directory = get_directory(use_db=False)
+    from backend.exports import EventExport
+    with EventExport(consultant['email'], args.export) if args.export else nullcontext() as export:
+        generated, _, _ = invoice_events(billable, consultant, branding, period_start, period_end, directory,
+                                         export=export, pdf=args.pdf)
 
     print('Generated invoices:', *generated, sep='\n - ')
+    if export is not None:
+        print('Exported billed events:', *export.paths, sep='\n - ')
 
 
 if __name__ == '__main__':
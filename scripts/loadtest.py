@@ -0,0 +1,372 @@
+#!/usr/bin/env python3
+"""End-to-end load test of the FastAPI app against local API stubs.
+
+Starts the Google/Anthropic/Resend stubs (scripts/stub_servers.py), runs the app
+under uvicorn with each requested worker count, and drives it with closed-loop
+virtual users replaying a weighted mix of /stt, /ai-invoice/allocate,
+/ai-invoice/finalize, /ai-invoice/send-email and /calendar/events. Each
+(workers, concurrency) step reports throughput, error rate and latency
+percentiles, overall and per endpoint. Runs fully offline; the app's DB, output/,
+exports/ and working files go to a temp dir.
+
+    python -m scripts.loadtest --workers 1,2 --concurrency 1,8,32 --duration 20
+    python -m scripts.loadtest --latency anthropic=1500,google=120 --error-rate 0.01
+    python -m scripts.loadtest --out load-branch.json --compare load-main.json
+"""
+import argparse
+import asyncio
+import json
+import logging
+import math
+import os
+import platform
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+from scripts import bench_data
+from scripts.benchmark import _git_commit
+from scripts.stub_servers import start_stubs, stub_env
+
+DEFAULT_MIX = 'calendar=3,allocate=3,finalize=2,send_email=1,stt=1'
+PERIOD = '2025-09-01:2025-09-30'
+PERCENTILES = (50, 90, 95, 99)
+
+
+def _parse_pairs(spec: str, cast=float) -> dict:
+    """'a=1,b=2' -> {'a': 1.0, 'b': 2.0}"""
+    out = {}
+    for part in filter(None, (p.strip() for p in spec.split(','))):
+        name, _, value = part.partition('=')
+        out[name.strip()] = cast(value)
+    return out
+
+
+def _ints(spec: str):
+    return [int(v) for v in spec.split(',') if v.strip()]
+
+
+def percentile(sorted_samples, p: float) -> float:
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_samples:
+        return 0.0
+    k = max(0, min(len(sorted_samples) - 1, math.ceil(p / 100 * len(sorted_samples)) - 1))
+    return sorted_samples[k]
+
+
+def _summary(samples, errors: int, elapsed: float) -> dict:
+    lat = sorted(samples)
+    n = len(lat) + errors
+    out = {'requests': n, 'errors': errors, 'error_rate': errors / n if n else 0.0,
+           'throughput_rps': len(lat) / elapsed if elapsed else 0.0}
+    out.update({f'p{p}_ms': percentile(lat, p) * 1000 for p in PERCENTILES})
+    out['max_ms'] = lat[-1] * 1000 if lat else 0.0
+    return out
+
+
+# ---------- APP UNDER TEST ----------
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def _seed_tokens(workdir: Path, token_uri: str) -> None:
+    """A signed-in consultant in the temp tokens.db, so /calendar/events can reach the Google stub."""
+    from sqlalchemy import create_engine
+    from sqlalchemy.orm import sessionmaker
+    from backend.db import Base, UserToken
+
+    engine = create_engine(f'sqlite:///{workdir / "tokens.db"}')
+    Base.metadata.create_all(engine)
+    db = sessionmaker(bind=engine)()
+    db.add(UserToken(
+        email=bench_data.CONSULTANT_EMAIL, access_token='stub-token', refresh_token='stub-refresh',
+        token_uri=token_uri, client_id='stub-client', client_secret='stub-secret',
+        expiry=datetime.utcnow() + timedelta(days=1), scopes='["https://www.googleapis.com/auth/calendar.readonly"]',
+    ))
+    db.commit()
+    db.close()
+    engine.dispose()
+
+
+class AppServer:
+    """`uvicorn backend.app:app --workers N` in `workdir`, pointed at the stubs."""
+
+    def __init__(self, workers: int, workdir: Path, env: dict):
+        self.workers, self.workdir = workers, workdir
+        self.port = _free_port()
+        self.env = {**os.environ, **env, 'PYTHONPATH': str(ROOT), 'INVOY_OUTPUT_DIR': str(workdir / 'output'),
+                    'INVOY_EXPORT_DIR': str(workdir / 'exports')}
+        self.env.setdefault('LOG_LEVEL', 'WARNING')
+        self.proc = None
+
+    @property
+    def url(self) -> str:
+        return f'http://127.0.0.1:{self.port}'
+
+    async def start(self, timeout: float = 60.0):
+        import httpx
+        cmd = [sys.executable, '-m', 'uvicorn', 'backend.app:app', '--host', '127.0.0.1',
+               '--port', str(self.port), '--workers', str(self.workers), '--log-level', 'warning', '--no-access-log']
+        self.proc = subprocess.Popen(cmd, cwd=self.workdir, env=self.env)
+        deadline = time.monotonic() + timeout
+        async with httpx.AsyncClient() as client:
+            while time.monotonic() < deadline:
+                if self.proc.poll() is not None:
+                    raise RuntimeError(f'app exited with {self.proc.returncode} during startup')
+                try:
+                    # /metrics answers once the lifespan warmup has finished
+                    if (await client.get(f'{self.url}/metrics', timeout=2.0)).status_code == 200:
+                        return self
+                except httpx.TransportError:
+                    pass
+                await asyncio.sleep(0.2)
+        self.stop()
+        raise RuntimeError(f'app did not come up within {timeout:.0f}s')
+
+    def stop(self):
+        if self.proc and self.proc.poll() is None:
+            self.proc.terminate()
+            try:
+                self.proc.wait(timeout=15)
+            except subprocess.TimeoutExpired:
+                self.proc.kill()
+
+
+# ---------- TRAFFIC ----------
+
+class Session:
+    """One virtual user. Finalize and send-email reuse what this user allocated and finalized last."""
+
+    def __init__(self, client, base_url: str, rng: random.Random, wav: bytes):
+        self.client, self.base, self.rng, self.wav = client, base_url, rng, wav
+        self.allocation = None
+        self.invoice = None
+
+    async def calendar(self):
+        n = self.rng.randrange(5)
+        return await self.client.get(f'{self.base}/calendar/events', params={
+            'attendee': f'client{n}.com', 'periodLabel': PERIOD, 'email': bench_data.CONSULTANT_EMAIL})
+
+    async def allocate(self):
+        # A few recurring texts (local allocator hits once finalized) among mostly new ones
+        seed = self.rng.randrange(8) if self.rng.random() < 0.3 else self.rng.randrange(10 ** 6)
+        freeform = bench_data.make_freeform(self.rng.choice([3, 5, 10]), seed=seed)
+        resp = await self.client.post(f'{self.base}/ai-invoice/allocate', json={'freeform': freeform})
+        if resp.status_code == 200 and resp.json().get('line_items'):
+            self.allocation = (freeform, resp.json())
+        return resp
+
+    async def finalize(self):
+        if self.allocation is None:
+            await self.allocate()
+        freeform, alloc = self.allocation or ('', {'line_items': [{'subject': 'General work', 'estimated_hours': 5}]})
+        items = [{'subject': i['subject'], 'hours': i['estimated_hours'], 'justification': i.get('justification', '')}
+                 for i in alloc['line_items']]
+        resp = await self.client.post(f'{self.base}/ai-invoice/finalize', json={
+            'client': f'Client {self.rng.randrange(5)} Inc', 'line_items': items,
+            'billing_period': '2025-09', 'freeform': freeform})
+        if resp.status_code == 200:
+            self.invoice = resp.json()
+        return resp
+
+    async def send_email(self):
+        if self.invoice is None:
+            await self.finalize()
+        invoice = self.invoice or {'invoice_id': 'missing'}
+        return await self.client.post(f'{self.base}/ai-invoice/send-email', json={
+            'invoice_id': invoice['invoice_id'], 'recipient_email': 'billing@client0.com', 'invoice_data': invoice})
+
+    async def stt(self):
+        return await self.client.post(f'{self.base}/stt', files={'file': ('note.wav', self.wav, 'audio/wav')})
+
+
+def _failed(resp) -> bool:
+    if resp.status_code >= 400:
+        return True
+    # Several endpoints report failures in a 200 body
+    if resp.headers.get('content-type', '').startswith('application/json'):
+        try:
+            body = resp.json()
+        except ValueError:
+            return True
+        return isinstance(body, dict) and (bool(body.get('error')) or body.get('status') == 'error')
+    return False
+
+
+async def run_step(base_url: str, concurrency: int, duration: float, mix: dict, wav: bytes,
+                   think_ms: float, seed: int) -> dict:
+    """`concurrency` users looping over the mix for `duration` seconds."""
+    import httpx
+
+    ops, weights = list(mix), list(mix.values())
+    samples = {op: [] for op in ops}
+    errors = {op: 0 for op in ops}
+    failures = {}
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+
+    async with httpx.AsyncClient(timeout=120.0, limits=limits) as client:
+        stop_at = time.monotonic() + duration
+
+        async def user(i: int):
+            rng = random.Random(seed * 1000 + i)
+            session = Session(client, base_url, rng, wav)
+            while time.monotonic() < stop_at:
+                op = rng.choices(ops, weights)[0]
+                start = time.perf_counter()
+                try:
+                    resp = await getattr(session, op)()
+                    failed = _failed(resp)
+                    reason = f'HTTP {resp.status_code}' if failed else None
+                except Exception as e:  # timeouts, dropped connections
+                    failed, reason = True, type(e).__name__
+                elapsed = time.perf_counter() - start
+                if failed:
+                    errors[op] += 1
+                    failures[(op, reason)] = failures.get((op, reason), 0) + 1
+                else:
+                    samples[op].append(elapsed)
+                if think_ms:
+                    await asyncio.sleep(rng.expovariate(1000.0 / think_ms))
+
+        started = time.perf_counter()
+        await asyncio.gather(*(user(i) for i in range(concurrency)))
+        elapsed = time.perf_counter() - started
+
+    everything = [s for op in ops for s in samples[op]]
+    return {
+        'concurrency': concurrency,
+        'duration_s': elapsed,
+        **_summary(everything, sum(errors.values()), elapsed),
+        'endpoints': {op: _summary(samples[op], errors[op], elapsed) for op in ops},
+        'failures': [{'endpoint': op, 'reason': r, 'count': n} for (op, r), n in sorted(failures.items())],
+    }
+
+
+def _print_step(workers: int, step: dict):
+    print(f"  workers {workers:>2}  users {step['concurrency']:>4}  {step['throughput_rps']:8.1f} req/s  "
+          f"p50 {step['p50_ms']:8.1f}  p90 {step['p90_ms']:8.1f}  p99 {step['p99_ms']:8.1f} ms  "
+          f"errors {step['error_rate'] * 100:5.1f}%")
+    for op, s in step['endpoints'].items():
+        if s['requests']:
+            print(f"      {op:<12} {s['requests']:>6}  {s['throughput_rps']:8.1f} req/s  "
+                  f"p50 {s['p50_ms']:8.1f}  p99 {s['p99_ms']:8.1f} ms  errors {s['errors']}")
+    for f in step['failures'][:5]:
+        print(f"      ! {f['endpoint']}: {f['reason']} x{f['count']}")
+
+
+async def run(args, stubs) -> list:
+    mix = _parse_pairs(args.mix)
+    unknown = set(mix) - {'calendar', 'allocate', 'finalize', 'send_email', 'stt'}
+    if unknown:
+        raise SystemExit(f'unknown endpoints in --mix: {", ".join(sorted(unknown))}')
+    mix = {op: w for op, w in mix.items() if w > 0}
+    results = []
+    with tempfile.TemporaryDirectory(prefix='invoy-load-') as tmp:
+        wav = bench_data.make_wav(Path(tmp) / 'note.wav', seconds=args.audio_seconds).read_bytes()
+        env = {**stub_env(stubs), **_parse_pairs(args.env, str)}
+        targets = [(None, args.url)] if args.url else [(w, None) for w in _ints(args.workers)]
+        for workers, url in targets:
+            server = None
+            if url is None:
+                workdir = Path(tmp) / f'workers-{workers}'
+                workdir.mkdir()
+                _seed_tokens(workdir, f"{stubs['google'].url}/token")
+                server = await AppServer(workers, workdir, env).start()
+                url = server.url
+            try:
+                for concurrency in _ints(args.concurrency):
+                    if args.warmup:
+                        await run_step(url, concurrency, args.warmup, mix, wav, args.think_ms, args.seed)
+                    step = await run_step(url, concurrency, args.duration, mix, wav, args.think_ms, args.seed)
+                    step['workers'] = workers
+                    results.append(step)
+                    _print_step(workers or 0, step)
+            finally:
+                if server:
+                    server.stop()
+    return results
+
+
+def compare(current, baseline, threshold: float) -> bool:
+    """Throughput and p99 per (workers, users) against a baseline run; True if any step regressed."""
+    base = {(r['workers'], r['concurrency']): r for r in baseline['results']}
+    regressed = False
+    print(f"\nvs {baseline.get('commit') or 'baseline'}:")
+    for r in current['results']:
+        b = base.get((r['workers'], r['concurrency']))
+        if not b or not b['throughput_rps'] or not b['p99_ms']:
+            continue
+        rps, p99 = r['throughput_rps'] / b['throughput_rps'], r['p99_ms'] / b['p99_ms']
+        flag = ''
+        if rps < 1 - threshold or p99 > 1 + threshold:
+            flag, regressed = '  REGRESSION', True
+        print(f"  workers {r['workers'] or 0:>2}  users {r['concurrency']:>4}  throughput {rps:5.2f}x  p99 {p99:5.2f}x{flag}")
+    return regressed
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Load test the app offline against local API stubs.')
+    parser.add_argument('--workers', default='1', help='Comma-separated uvicorn worker counts to test')
+    parser.add_argument('--concurrency', default='1,4,16,32', help='Comma-separated virtual user counts')
+    parser.add_argument('--duration', type=float, default=20.0, help='Seconds measured per step')
+    parser.add_argument('--warmup', type=float, default=3.0, help='Unmeasured seconds before each step')
+    parser.add_argument('--mix', default=DEFAULT_MIX, help='Relative request weights per endpoint')
+    parser.add_argument('--think-ms', type=float, default=0.0, help='Mean pause between a user\'s requests')
+    parser.add_argument('--latency-ms', type=float, default=0.0, help='Mean latency injected by every stub')
+    parser.add_argument('--latency', default='', help='Per-stub overrides, e.g. anthropic=1500,google=120')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Fraction of stub requests that fail')
+    parser.add_argument('--events', type=int, default=200, help='Events per stub calendar')
+    parser.add_argument('--calendars', type=int, default=1, help='Number of stub calendars')
+    parser.add_argument('--audio-seconds', type=float, default=5.0, help='Length of the synthetic /stt upload')
+    parser.add_argument('--env', default='', help='Extra app environment, e.g. CALENDAR_CACHE_TTL=0,STT_WORKERS=2')
+    parser.add_argument('--url', help='Load an already running app instead (stubs and DB are up to you)')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--out', default='loadtest_output.json', help='Where to write JSON results')
+    parser.add_argument('--compare', type=Path, help='Baseline JSON to compare throughput and p99 against')
+    parser.add_argument('--threshold', type=float, default=0.2, help='Relative change treated as a regression')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    stubs = start_stubs(latency_ms=args.latency_ms, error_rate=args.error_rate,
+                        n_events=args.events, n_calendars=args.calendars)
+    for name, ms in _parse_pairs(args.latency).items():
+        stubs[name].latency_ms = ms
+    try:
+        results = asyncio.run(run(args, stubs))
+    finally:
+        for s in stubs.values():
+            s.stop()
+
+    report = {
+        'commit': _git_commit(),
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+        'config': {k: v for k, v in vars(args).items() if k not in ('out', 'compare')},
+        'stub_latency_ms': {name: s.latency_ms for name, s in stubs.items()},
+        'stub_requests': {name: s.requests for name, s in stubs.items()},
+        'results': results,
+    }
+    Path(args.out).write_text(json.dumps(report, indent=2, default=str))
+    print(f'\nWrote {args.out}')
+
+    if args.compare:
+        if compare(report, json.loads(args.compare.read_text()), args.threshold):
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
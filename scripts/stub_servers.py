@@ -0,0 +1,285 @@
+#!/usr/bin/env python3
+"""Local stand-ins for the Google, Anthropic and Resend APIs.
+
+Each stub is a threaded HTTP server on 127.0.0.1 with configurable latency and
+error rate, so benchmarks and load tests run fully offline. `stub_env()` returns
+the environment variables that point the backend at them.
+
+    python scripts/stub_servers.py --latency-ms 200 --error-rate 0.01
+"""
+import argparse
+import gzip
+import json
+import random
+import re
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs, unquote
+
+try:
+    from scripts.bench_data import make_events
+except ImportError:
+    from bench_data import make_events
+
+
+class _Handler(BaseHTTPRequestHandler):
+    stub = None  # set per server class
+
+    def log_message(self, *args):
+        pass
+
+    def _body(self):
+        n = int(self.headers.get('Content-Length') or 0)
+        raw = self.rfile.read(n) if n else b''
+        try:
+            return json.loads(raw or b'{}')
+        except ValueError:
+            return {}
+
+    def _send(self, status, payload):
+        data = json.dumps(payload).encode()
+        self.stub.bytes_sent += len(data)
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        if 'gzip' in (self.headers.get('Accept-Encoding') or ''):
+            data = gzip.compress(data, compresslevel=5)
+            self.send_header('Content-Encoding', 'gzip')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _dispatch(self, method):
+        stub = self.stub
+        stub.requests += 1
+        if stub.latency_ms:
+            time.sleep(stub.rng.uniform(0.5, 1.5) * stub.latency_ms / 1000.0)
+        if stub.error_rate and stub.rng.random() < stub.error_rate:
+            stub.errors += 1
+            return self._send(stub.error_status, {'error': {'type': 'stub_error', 'message': 'injected failure'}})
+        url = urlparse(self.path)
+        status, payload = stub.handle(method, url.path, parse_qs(url.query), self._body() if method == 'POST' else {})
+        self._send(status, payload)
+
+    def do_GET(self):
+        self._dispatch('GET')
+
+    def do_POST(self):
+        self._dispatch('POST')
+
+
+class StubServer:
+    name = 'stub'
+    error_status = 500
+
+    def __init__(self, latency_ms: float = 0.0, error_rate: float = 0.0, seed: int = 0):
+        self.latency_ms, self.error_rate = latency_ms, error_rate
+        self.rng = random.Random(seed)
+        self.requests = self.errors = 0
+        self.bytes_sent = 0  # uncompressed response bytes
+        handler = type(f'{type(self).__name__}Handler', (_Handler,), {'stub': self})
+        self.httpd = ThreadingHTTPServer(('127.0.0.1', 0), handler)
+        self.httpd.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        host, port = self.httpd.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def start(self):
+        self._thread = threading.Thread(target=self.httpd.serve_forever, name=self.name, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def handle(self, method, path, query, body):
+        return 404, {'error': f'no stub route for {method} {path}'}
+
+
+def _parse_fields(spec: str) -> dict:
+    """Google partial-response `fields` ("a,b(c,d)") as a nested dict; {} means everything."""
+    tree, stack, name = {}, [], ''
+    node = tree
+    for ch in spec + ',':
+        if ch in ',()' and name.strip():
+            node[name.strip()] = {}
+        if ch == '(':
+            stack.append(node)
+            node = node[name.strip()]
+        elif ch == ')':
+            node = stack.pop()
+        if ch in ',()':
+            name = ''
+        else:
+            name += ch
+    return tree
+
+
+def _project(value, tree: dict):
+    if not tree:
+        return value
+    if isinstance(value, list):
+        return [_project(v, tree) for v in value]
+    if isinstance(value, dict):
+        return {k: _project(value[k], sub) for k, sub in tree.items() if k in value}
+    return value
+
+
+def _full_resource(ev: dict, cal: str) -> dict:
+    """Pad a bench event with the metadata the real API returns by default."""
+    return {
+        'kind': 'calendar#event', 'etag': f'"{ev["id"]}-0"',
+        'htmlLink': f'https://www.google.com/calendar/event?eid={ev["id"]}',
+        'created': '2025-08-01T10:00:00.000Z', 'updated': '2025-08-02T10:00:00.000Z',
+        'creator': {'email': cal if '@' in cal else 'consultant@example.com'},
+        'organizer': {'email': cal if '@' in cal else 'consultant@example.com', 'self': True},
+        'sequence': 0, 'eventType': 'default',
+        'reminders': {'useDefault': True},
+        'conferenceData': {
+            'entryPoints': [{'entryPointType': 'video', 'uri': f'https://meet.google.com/{ev["id"][-6:]}', 'label': 'meet'}],
+            'conferenceSolution': {'key': {'type': 'hangoutsMeet'}, 'name': 'Google Meet',
+                                   'iconUri': 'https://fonts.gstatic.com/s/i/productlogos/meet_2020q4/v6/web-512dp/logo_meet_2020q4_color_2x_web_512dp.png'},
+            'conferenceId': ev['id'][-6:],
+        },
+        **ev,
+        'attendees': [{**a, 'responseStatus': 'accepted'} for a in ev.get('attendees', [])],
+    }
+
+
+def _search_match(ev: dict, q: str) -> bool:
+    """Token-based like the API's `q`: every term must be a whole word of the text fields or an attendee.
+
+    "Client 0 Inc" finds nothing in an event with contact0@client0.com; the full email does.
+    """
+    attendees = ev.get('attendees', [])
+    emails = {(a.get('email') or '').lower() for a in attendees}
+    text = ' '.join([ev.get('summary') or '', ev.get('description') or '', ev.get('location') or '',
+                     *(a.get('displayName') or '' for a in attendees), *emails])
+    words = set(re.findall(r'\w+', text.lower()))
+    return all(t in emails or set(re.findall(r'\w+', t)) <= words for t in q.lower().split())
+
+
+class GoogleStub(StubServer):
+    """Calendar v3 events/calendarList, OAuth token refresh and userinfo."""
+    name = 'google-stub'
+
+    def __init__(self, n_events: int = 200, n_calendars: int = 1, **kw):
+        super().__init__(**kw)
+        # Calendar-level last modification time; bump it to simulate edits
+        self.updated = '2025-09-30T00:00:00.000Z'
+        self.calendars = ['primary'] + [f'team{i}@group.calendar.google.com' for i in range(1, n_calendars)]
+        primary = [_full_resource(e, 'primary') for e in make_events(n_events)]
+        # Secondary calendars repeat a tenth of the primary events, like meetings on a shared team calendar
+        self.events = {'primary': primary}
+        for i, cal in enumerate(self.calendars[1:], start=1):
+            own = [_full_resource({**e, 'id': f"{e['id']}_{i}", 'iCalUID': f"{e['id']}_{i}@bench"}, cal)
+                   for e in make_events(n_events, seed=i)]
+            self.events[cal] = sorted(own + primary[:n_events // 10], key=lambda e: e['start']['dateTime'])
+
+    def handle(self, method, path, query, body):
+        if path == '/token':
+            return 200, {'access_token': uuid.uuid4().hex, 'expires_in': 3600, 'token_type': 'Bearer'}
+        if path == '/oauth2/v2/userinfo':
+            return 200, {'email': 'consultant@example.com', 'name': 'John Consultant'}
+        fields = _parse_fields(query.get('fields', [''])[0])
+        if path == '/calendar/v3/users/me/calendarList':
+            items = [{'kind': 'calendar#calendarListEntry', 'id': c, 'summary': c, 'timeZone': 'UTC', 'selected': True,
+                      'accessRole': 'reader', 'primary': c == 'primary'} for c in self.calendars]
+            return 200, _project({'kind': 'calendar#calendarList', 'items': items}, fields)
+        m = re.match(r'^/calendar/v3/calendars/([^/]+)/events$', path)
+        if m and unquote(m.group(1)) in self.events:
+            items = self.events[unquote(m.group(1))]
+            t_min, t_max = query.get('timeMin', [''])[0][:10], query.get('timeMax', ['9999'])[0][:10]
+            items = [e for e in items if t_min <= e['start']['dateTime'][:10] < t_max] if t_min else items
+            if 'eventTypes' in query:
+                items = [e for e in items if e.get('eventType', 'default') in query['eventTypes']]
+            if query.get('q'):
+                items = [e for e in items if _search_match(e, query['q'][0])]
+            payload = {'kind': 'calendar#events', 'etag': '"stub"', 'updated': self.updated, 'items': items}
+            return 200, _project(payload, fields)
+        return super().handle(method, path, query, body)
+
+
+class AnthropicStub(StubServer):
+    """/v1/messages returning an even-split allocation for the subjects in the prompt."""
+    name = 'anthropic-stub'
+    error_status = 529
+
+    def handle(self, method, path, query, body):
+        if path != '/v1/messages':
+            return super().handle(method, path, query, body)
+        prompt = ''.join(m.get('content') if isinstance(m.get('content'), str) else '' for m in body.get('messages', []))
+        if 'Freeform input' in prompt:
+            subjects = re.findall(r'^\s*[-•]\s*(.+)$', prompt.split('Constraints:')[0], flags=re.M) or ['General work']
+            m = re.search(r'(\d+(?:\.\d+)?)\s*(?:h|hrs|hours)', prompt)
+            total = float(m.group(1)) if m else 10.0
+            each = round(total / len(subjects), 1)
+            text = json.dumps({
+                'client_name': 'Stub Client', 'total_hours_billed': total, 'billing_period': 'Monthly',
+                'line_items': [{'subject': s.strip(), 'estimated_hours': each, 'justification': 'Stub allocation.'} for s in subjects],
+                'confidence': 0.9,
+            })
+        else:
+            text = '<p>Hi there,</p><p>Please find the invoice attached.</p><p>Best regards</p>'
+        return 200, {
+            'id': f'msg_{uuid.uuid4().hex[:24]}', 'type': 'message', 'role': 'assistant',
+            'model': body.get('model', 'stub'), 'content': [{'type': 'text', 'text': text}],
+            'stop_reason': 'end_turn', 'stop_sequence': None,
+            'usage': {'input_tokens': len(prompt) // 4, 'output_tokens': len(text) // 4},
+        }
+
+
+class ResendStub(StubServer):
+    name = 'resend-stub'
+
+    def handle(self, method, path, query, body):
+        if method == 'POST' and path == '/emails':
+            return 200, {'id': str(uuid.uuid4())}
+        return super().handle(method, path, query, body)
+
+
+def start_stubs(latency_ms: float = 0.0, error_rate: float = 0.0, n_events: int = 200, n_calendars: int = 1):
+    return {
+        'google': GoogleStub(n_events=n_events, n_calendars=n_calendars, latency_ms=latency_ms, error_rate=error_rate).start(),
+        'anthropic': AnthropicStub(latency_ms=latency_ms, error_rate=error_rate).start(),
+        'resend': ResendStub(latency_ms=latency_ms, error_rate=error_rate).start(),
+    }
+
+
+def stub_env(stubs) -> dict:
+    """Environment that points the backend (and the SDKs it uses) at the stubs."""
+    return {
+        'GOOGLE_API_BASE': stubs['google'].url,
+        'ANTHROPIC_BASE_URL': stubs['anthropic'].url,
+        'ANTHROPIC_API_KEY': 'stub-key',
+        'RESEND_API_URL': stubs['resend'].url,
+        'RESEND_API_KEY': 're_stub',
+        'RESEND_FROM_EMAIL': 'invoices@example.com',
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run local Google/Anthropic/Resend stub servers.')
+    parser.add_argument('--latency-ms', type=float, default=0.0, help='Mean injected latency per request')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Fraction of requests that fail')
+    parser.add_argument('--events', type=int, default=200, help='Events per stub calendar')
+    parser.add_argument('--calendars', type=int, default=1, help='Number of stub calendars')
+    args = parser.parse_args()
+    stubs = start_stubs(args.latency_ms, args.error_rate, args.events, args.calendars)
+    for k, v in stub_env(stubs).items():
+        print(f'export {k}={v}')
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        for s in stubs.values():
+            s.stop()
+
+
+if __name__ == '__main__':
+    main()
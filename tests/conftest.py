@@ -0,0 +1,20 @@
+import sys
+from pathlib import Path
+
+import pytest
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+
+
+@pytest.fixture
+def directory(monkeypatch):
+    """A small client directory standing in for data/config.json and the DB."""
+    from backend import clients
+    d = clients.ClientDirectory([
+        clients.Client(key='acme', name='Acme Corp', email='jane.doe@acme.com', company='Acme Corporation',
+                       domains=('acme.com',), aliases=('acme',)),
+        clients.Client(key='globex', name='Globex', email='ops@globex.io', domains=('globex.io',)),
+    ])
+    monkeypatch.setattr(clients, 'get_directory', lambda *a, **k: d)
+    return d
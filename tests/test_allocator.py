@@ -0,0 +1,49 @@
+from backend.allocator import AllocationMemory
+
+
+def _memory(*entries):
+    # Entries added directly; record() would persist them to the DB
+    memory = AllocationMemory()
+    memory._loaded = True
+    for client, text, items in entries:
+        memory._add({'client': client, 'text': text, 'billing_period': 'Monthly',
+                     'total_hours': sum(h for _, h in items),
+                     'line_items': [{'subject': s, 'estimated_hours': h, 'justification': ''} for s, h in items]})
+    return memory
+
+
+def test_recurring_subjects_answered_locally(directory):
+    memory = _memory(('Acme Corp', 'Architecture review, API gateway setup',
+                      [('Architecture review', 6.0), ('API gateway setup', 4.0)]))
+    result = memory.suggest('20h: Architecture review, API gateway setup', 'Acme Corp')
+    assert result['path'] == 'local'
+    assert [i['estimated_hours'] for i in result['line_items']] == [12.0, 8.0]
+
+
+def test_new_subject_escalates(directory):
+    memory = _memory(('Acme Corp', 'Architecture review, API gateway setup',
+                      [('Architecture review', 6.0), ('API gateway setup', 4.0)]))
+    # Similar enough overall, but "Security audit" has no past line item to go under
+    assert memory.suggest('Architecture review, API gateway setup, Security audit 20h', 'Acme Corp',
+                          min_confidence=0.5) is None
+
+
+def test_dropped_subject_escalates(directory):
+    memory = _memory(('Acme Corp', 'Architecture review, API gateway setup, Security audit',
+                      [('Architecture review', 6.0), ('API gateway setup', 4.0), ('Security audit', 2.0)]))
+    assert memory.suggest('Architecture review, API gateway setup 20h', 'Acme Corp', min_confidence=0.5) is None
+
+
+def test_aliases_share_history(directory):
+    memory = _memory(('acme', 'Sprint planning, code review', [('Sprint planning', 3.0), ('Code review', 5.0)]))
+    assert memory.suggest('Sprint planning, code review 8h', 'Acme Corp')['path'] == 'local'
+    assert memory.suggest('Sprint planning, code review 8h', 'Globex') is None
+
+
+def test_heuristic_allocations_not_recorded(directory):
+    memory = _memory()
+    memory.record('Acme Corp', [{'subject': 'API work', 'estimated_hours': 5.0, 'justification': 'x'}],
+                  'Monthly', 'API work 5h', source='heuristic')
+    memory.record('Acme Corp', [{'subject': 'API work', 'estimated_hours': 5.0,
+                                 'justification': 'Even split (fallback)'}], 'Monthly', 'API work 5h')
+    assert len(memory) == 0
@@ -0,0 +1,50 @@
+from backend.clients import filter_events
+
+ME = 'consultant@example.com'
+
+
+def _event(*emails):
+    return {'attendees': [{'email': ME}] + [{'email': e} for e in emails]}
+
+
+EVENTS = [
+    _event('jane.doe@acme.com'),
+    _event('bob@globex.io'),
+    _event('ann@initech.example.org'),
+    _event('john.doe@initech.com'),
+    _event('sam@sub.initech.com'),
+    _event('jane.doe@acme.com', 'bob@globex.io'),
+]
+
+
+def _idx(events):
+    return [EVENTS.index(e) for e in events]
+
+
+def test_known_client_by_name_alias_or_domain(directory):
+    assert _idx(filter_events(EVENTS, 'Acme Corp', ME)) == [0, 5]
+    assert _idx(filter_events(EVENTS, 'acme', ME)) == [0, 5]
+    assert _idx(filter_events(EVENTS, 'acme.com', ME)) == [0, 5]
+
+
+def test_meeting_with_two_clients_bills_to_one(directory):
+    # jane.doe@acme.com (acme) and bob@globex.io (globex): the lowest key wins the tie
+    assert 5 not in _idx(filter_events(EVENTS, 'Globex', ME))
+
+
+def test_unknown_domain_matches_subdomains(directory):
+    assert _idx(filter_events(EVENTS, 'initech.com', ME)) == [3, 4]
+    assert _idx(filter_events(EVENTS, '@initech.com', ME)) == [3, 4]
+
+
+def test_unknown_email_exact(directory):
+    assert _idx(filter_events(EVENTS, 'sam@sub.initech.com', ME)) == [4]
+
+
+def test_dotted_local_part_falls_back_to_substring(directory):
+    assert _idx(filter_events(EVENTS, 'john.doe', ME)) == [3]
+    assert _idx(filter_events(EVENTS, 'jane.doe', ME)) == [0, 5]
+
+
+def test_plain_substring(directory):
+    assert _idx(filter_events(EVENTS, 'initech', ME)) == [2, 3, 4]
@@ -0,0 +1,6 @@
+from scripts.check_import_time import check
+
+
+def test_backend_app_import_stays_lazy_and_within_budget():
+    median_ms, ratio, _, failures = check(runs=3)
+    assert not failures, f'{failures} ({median_ms:.0f} ms, {ratio:.2f}x)'
@@ -0,0 +1,36 @@
+import threading
+import time
+
+from backend import pdf
+from backend.artifacts import ArtifactStore
+
+
+def test_concurrent_requests_render_once(tmp_path, monkeypatch):
+    store = ArtifactStore(tmp_path)
+    invoice_id = store.new_invoice_id('INV', 'Acme Corp')
+    store.write_text(invoice_id, 'html', '<p>invoice</p>')
+    renders = []
+
+    def render(html):
+        renders.append(html)
+        time.sleep(0.05)
+        return b'%PDF'
+
+    monkeypatch.setattr(pdf, 'store', store)
+    monkeypatch.setattr(pdf, 'cache', pdf.PdfCache(1 << 20))
+    monkeypatch.setattr(pdf, 'render_pdf', render)
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(pdf.get_invoice_pdf(invoice_id))) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert results == [b'%PDF'] * 8
+    assert len(renders) == 1
+    assert not pdf.cache._inflight
+
+
+def test_missing_invoice(tmp_path, monkeypatch):
+    monkeypatch.setattr(pdf, 'store', ArtifactStore(tmp_path))
+    monkeypatch.setattr(pdf, 'cache', pdf.PdfCache(1 << 20))
+    assert pdf.get_invoice_pdf(ArtifactStore(tmp_path).new_invoice_id('INV', 'Acme')) is None
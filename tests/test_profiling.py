@@ -0,0 +1,71 @@
+import asyncio
+import json
+import time
+
+import pytest
+
+pytest.importorskip('pyinstrument')
+httpx = pytest.importorskip('httpx')
+
+from fastapi import FastAPI
+
+from backend import profiling
+
+
+def _spin_profiled():
+    t = time.perf_counter()
+    while time.perf_counter() - t < 0.01:
+        pass
+
+
+def _spin_other():
+    t = time.perf_counter()
+    while time.perf_counter() - t < 0.01:
+        pass
+
+
+def _app():
+    app = FastAPI()
+    app.router.route_class = profiling.ProfilingRoute
+    app.middleware("http")(profiling.profile_requests)
+
+    @app.get('/profiled')
+    async def profiled():
+        for _ in range(10):
+            _spin_profiled()
+            await asyncio.sleep(0.005)
+        return {}
+
+    @app.get('/profiled-sync')
+    def profiled_sync():
+        for _ in range(10):
+            _spin_profiled()
+        return {}
+
+    @app.get('/other')
+    async def other():
+        for _ in range(10):
+            _spin_other()
+            await asyncio.sleep(0.005)
+        return {}
+
+    return app
+
+
+@pytest.mark.parametrize('path', ['/profiled', '/profiled-sync'])
+def test_profile_excludes_concurrent_requests(path, tmp_path, monkeypatch):
+    monkeypatch.setattr(profiling, 'ADMIN_TOKEN', 'secret')
+    monkeypatch.setattr(profiling, 'PROFILE_DIR', tmp_path)
+
+    async def run():
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=_app()), base_url='http://test') as c:
+            return await asyncio.gather(c.get(path, headers={'x-profile': '1', 'x-admin-token': 'secret'}),
+                                        c.get('/other'))
+
+    profiled, _ = asyncio.run(run())
+    profile_id = profiled.headers['x-profile-id']
+    speedscope = (tmp_path / f'{profile_id}.speedscope.json').read_text()
+    assert '_spin_profiled' in speedscope
+    assert '_spin_other' not in speedscope
+    meta = json.loads((tmp_path / f'{profile_id}.meta.json').read_text())
+    assert meta['scope'] == 'request'
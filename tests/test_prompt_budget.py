@@ -0,0 +1,58 @@
+import asyncio
+import json
+from types import SimpleNamespace
+
+from backend import ai
+from backend.prompt_budget import ALLOCATE_MIN_OUTPUT_TOKENS, output_budget, prepare, split_subjects
+
+
+def test_split_subjects_single_line():
+    assert split_subjects('20h: A, B, C, D, E, F, G, H') == list('ABCDEFGH')
+
+
+def test_split_subjects_bullets_and_totals():
+    text = '- API work 6h\n- Review (4h)\n1. Design. Build\nTotal: 10 hours\n- api work'
+    assert split_subjects(text) == ['API work', 'Review', 'Design', 'Build']
+
+
+def test_output_budget_floor():
+    assert output_budget(0) == ALLOCATE_MIN_OUTPUT_TOKENS
+    assert output_budget(3) == ALLOCATE_MIN_OUTPUT_TOKENS
+    assert output_budget(40) > ALLOCATE_MIN_OUTPUT_TOKENS
+
+
+def test_prepare_dedups_and_condenses():
+    text = '\n'.join(['Total 40h'] + ['Same line again'] * 5 + [f'Long prose line number {i} ' * 10 for i in range(50)])
+    prepared = prepare(text, ai._line_priority, budget=100)
+    assert prepared.duplicate_lines == 4
+    assert prepared.dropped_lines > 0
+    assert prepared.text.startswith('Total 40h')
+    assert prepared.estimated_tokens <= 100
+
+
+def test_heuristic_fallback_reports_usage(monkeypatch):
+    monkeypatch.delenv('ANTHROPIC_API_KEY', raising=False)
+    result = asyncio.run(ai.parse_freeform_with_claude('20h: API, docs, review', None, None))
+    assert result['path'] == 'heuristic'
+    assert [i['subject'] for i in result['line_items']] == ['API', 'docs', 'review']
+    assert result['usage']['input_lines'] == 1
+
+
+def test_single_line_subjects_sized_for_claude(monkeypatch):
+    calls = []
+
+    def create(**kwargs):
+        calls.append(kwargs)
+        reply = {'client_name': 'Acme', 'total_hours_billed': 20,
+                 'line_items': [{'subject': s, 'estimated_hours': 2.5, 'justification': ''} for s in 'ABCDEFGH']}
+        return SimpleNamespace(content=[SimpleNamespace(text=json.dumps(reply))], stop_reason='end_turn',
+                               usage=SimpleNamespace(input_tokens=100, output_tokens=200))
+
+    fake = SimpleNamespace(Anthropic=lambda: SimpleNamespace(messages=SimpleNamespace(create=create)))
+    monkeypatch.setenv('ANTHROPIC_API_KEY', 'test')
+    monkeypatch.setattr(ai, '_claude', lambda: fake)
+    result = asyncio.run(ai.parse_freeform_with_claude('20h: A, B, C, D, E, F, G, H', None, None))
+    prompt = calls[0]['messages'][0]['content']
+    assert 'about 8 subjects' in prompt and 'about 0 subjects' not in prompt
+    assert calls[0]['max_tokens'] >= ALLOCATE_MIN_OUTPUT_TOKENS
+    assert result['path'] == 'claude' and len(result['line_items']) == 8
@@ -0,0 +1,77 @@
+import asyncio
+import json
+
+from backend import calender_routes
+from backend.singleflight import SingleFlightCache
+
+
+def test_concurrent_callers_share_one_computation():
+    calls = []
+
+    async def compute():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return 'value', 'v1'
+
+    async def run():
+        cache = SingleFlightCache('test', ttl=60, max_age=600)
+        results = await asyncio.gather(*(cache.run('k', compute) for _ in range(5)))
+        return results + [await cache.run('k', compute)]
+
+    assert asyncio.run(run()) == ['value'] * 6
+    assert len(calls) == 1
+
+
+def test_unversioned_results_are_not_cached():
+    calls = []
+
+    async def compute():
+        calls.append(1)
+        return {'error': 'upstream failed'}, None
+
+    async def run():
+        cache = SingleFlightCache('test', ttl=60, max_age=600)
+        await cache.run('k', compute)
+        await cache.run('k', compute)
+
+    asyncio.run(run())
+    assert len(calls) == 2
+
+
+def test_stale_entries_revalidate_by_version():
+    versions = iter(['v1', 'v2'])
+    computed = []
+
+    async def compute():
+        computed.append(1)
+        return len(computed), 'v1' if len(computed) == 1 else 'v2'
+
+    async def revalidate():
+        return next(versions)
+
+    async def run():
+        cache = SingleFlightCache('test', ttl=0, max_age=600)
+        first = await cache.run('k', compute, revalidate)
+        # ttl=0: every later call revalidates; the first still matches v1, then v2 recomputes
+        return [first, await cache.run('k', compute, revalidate), await cache.run('k', compute, revalidate)]
+
+    assert asyncio.run(run()) == [1, 1, 2]
+
+
+def test_calendar_cache_is_keyed_on_the_resolved_account(monkeypatch):
+    # Without an email the latest login is used; two logins must not share a cache entry
+    accounts = iter(['first@example.com', 'second@example.com'])
+    monkeypatch.setattr(calender_routes, 'calendar_invoices', SingleFlightCache('test', ttl=60, max_age=600))
+    monkeypatch.setattr(calender_routes, '_account_email', lambda email: email or next(accounts))
+
+    async def invoice(attendee, period, email, save_to_file):
+        return {'account': email}, 'v1'
+
+    monkeypatch.setattr(calender_routes, '_calendar_invoice', invoice)
+
+    async def get():
+        response = await calender_routes.get_calendar_events('acme', '2025-09-01:2025-09-30', None, False)
+        return json.loads(response.body)['account']
+
+    assert asyncio.run(get()) == 'first@example.com'
+    assert asyncio.run(get()) == 'second@example.com'
@@ -0,0 +1,79 @@
+import math
+import random
+import sys
+import types
+import wave
+from array import array
+
+import pytest
+
+from backend import stt
+
+RATE = 16000
+
+
+def _pcm(blocks):
+    """16-bit mono PCM from (seconds, dBFS, tone) blocks: a 200 Hz tone, or white noise."""
+    rng = random.Random(0)
+    out = array('h')
+    for seconds, dbfs, tone in blocks:
+        amp = 32767 * 10 ** (dbfs / 20) * math.sqrt(2)
+        for i in range(int(seconds * RATE)):
+            s = amp * math.sin(2 * math.pi * 200 * i / RATE) if tone else amp / math.sqrt(2) * rng.gauss(0, 1)
+            out.append(int(max(-32768, min(32767, s))))
+    return out.tobytes()
+
+
+def test_quiet_speech_over_noise_floor_is_kept():
+    # -45 dBFS speech over a -55 dBFS noise floor, below the old fixed -40 dBFS threshold
+    pcm = _pcm([(2, -55, False), (1, -45, True), (2, -55, False)])
+    segments = stt.speech_segments(pcm, RATE)
+    assert len(segments) == 1
+    start, end = segments[0]
+    assert start <= 2 * RATE * 2 <= 3 * RATE * 2 <= end
+    assert end - start < len(pcm) / 2
+
+
+def test_little_speech_falls_back_to_whole_file():
+    pcm = _pcm([(0.15, -30, True), (9.85, -60, False)])
+    assert stt.speech_segments(pcm, RATE) == [(0, len(pcm))]
+
+
+def test_digital_silence_decodes_nothing():
+    assert stt.speech_segments(bytes(RATE * 2), RATE) == []
+
+
+@pytest.fixture
+def fake_vosk(monkeypatch):
+    fed = []
+
+    class Recognizer:
+        def __init__(self, model, rate):
+            pass
+
+        def AcceptWaveform(self, data):
+            fed.append(len(data))
+            return False
+
+        def FinalResult(self):
+            return '{"text": "hello"}'
+
+    monkeypatch.setitem(sys.modules, 'vosk', types.SimpleNamespace(KaldiRecognizer=Recognizer))
+    monkeypatch.setattr(stt, 'get_model', lambda: None)
+    return fed
+
+
+def test_transcribe_streams_only_voiced_audio(tmp_path, fake_vosk):
+    pcm = _pcm([(3, -60, False), (1, -30, True), (3, -60, False)])
+    path = tmp_path / 'note.wav'
+    with wave.open(str(path), 'wb') as wf:
+        wf.setnchannels(1)
+        wf.setsampwidth(2)
+        wf.setframerate(RATE)
+        wf.writeframes(pcm)
+    result = stt.transcribe(str(path))
+    assert result['text'] == 'hello'
+    assert result['duration_s'] == 7.0
+    assert 1.0 <= result['voiced_s'] < 2.0
+    assert sum(fake_vosk) == result['voiced_s'] * RATE * 2
+    assert max(fake_vosk) <= stt.READ_FRAMES * 2
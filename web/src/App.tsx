@@ -233,7 +233,9 @@ export default function App() {
         body: JSON.stringify({ 
           client: allocData.client_name, 
           line_items: allocData.line_items, 
-          billing_period: allocData.billing_period 
+          billing_period: allocData.billing_period,
+          freeform: allocData.freeform,
+          allocation_path: allocData.path
         }) 
       })
       const data = await res.json()
@@ -290,7 +292,7 @@ export default function App() {
           <div className="flex items-center justify-between pb-2 border-b border-slate-200 dark:border-slate-700">
             <div>
               <div className="font-semibold text-slate-900 dark:text-slate-100">{data.client_name || 'Unknown Client'}</div>
-              <div className="text-xs text-slate-500 dark:text-slate-400 mt-0.5">Total: {(data.total_hours_billed || 0).toFixed(1)}h • Confidence: {((data.confidence || 0) * 100).toFixed(0)}%</div>
+              <div className="text-xs text-slate-500 dark:text-slate-400 mt-0.5">Total: {(data.total_hours_billed || 0).toFixed(1)}h • Confidence: {((data.confidence || 0) * 100).toFixed(0)}%{data.path === 'local' ? ' • Matched a past invoice' : ''}</div>
             </div>
           </div>
           <div className="max-h-[280px] overflow-y-auto rounded-xl border border-slate-200 dark:border-slate-700">
@@ -305,7 +307,7 @@ export default function App() {
               <tbody className="bg-white dark:bg-slate-800">{rows}</tbody>
             </table>
           </div>
-          <button onClick={()=>finalizeInvoice(data)} className="w-full rounded-xl px-4 py-3 bg-gradient-to-r from-emerald-500 to-emerald-600 hover:from-emerald-600 hover:to-emerald-700 text-white font-semibold shadow-lg hover:shadow-xl transition-all">
+          <button onClick={()=>finalizeInvoice({ ...data, freeform: inputText })} className="w-full rounded-xl px-4 py-3 bg-gradient-to-r from-emerald-500 to-emerald-600 hover:from-emerald-600 hover:to-emerald-700 text-white font-semibold shadow-lg hover:shadow-xl transition-all">
             Finalize & Generate Invoice
           </button>
         </div>